@@ -1,16 +1,98 @@
-from typing import List
-import pandas as pd
-import pyarrow as pa
-from pyarrow import json as pj
-from pyarrow import parquet as pq
+# Các thư viện nặng (pyarrow, google.cloud.storage) được import trong hàm cần dùng
+# để container khởi động nhanh. loguru vẫn import ở đây vì mọi stage đều log qua nó
+# trước khi blob đầu tiên xong, import muộn cũng không giảm time_to_first_blob
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING, List, Optional
+import argparse
+import functools
+import io
 
 from decouple import Config, RepositoryEnv
-from google.cloud import storage
 from loguru import logger
 import json
 
+from batch_job.common.instrumentation import (
+    add_instrumentation_arguments,
+    instrumented_run,
+    record_stage,
+    seconds_since_process_start,
+    stage,
+)
+from batch_job.common.storage import (
+    StorageBackend,
+    get_storage_backend,
+    set_storage_backend,
+    storage_backend_from_config,
+)
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+    from google.cloud import storage
+    from batch_job.common.notifications import NotificationSource
+
 
-def list_file_in_bucket(bucket_name: str, prefix: str) -> List[storage.Blob]:
+@functools.lru_cache(maxsize=None)
+def event_json_schema() -> pa.Schema:
+    """
+    Tạo schema của file event json ở bronze-zone
+    """
+    import pyarrow as pa
+
+    return pa.schema([
+    #TODO: Begin 
+        ('event_id', pa.string()),
+        ('event_type', pa.string()),
+        ('timestamp',  pa.string()),
+        ('user_id', pa.int32()),
+        ('location', pa.string()),
+        ('device', pa.string()),
+        ('ip_address', pa.string()),
+        ('event_attribute', pa.list_(pa.struct([
+            ('key', pa.string()),
+            ('int_value', pa.int32()),
+            ('float_value', pa.float32()),
+            ('string_value', pa.string()),
+            ('bool_value', pa.bool_())
+    ])))
+    #TODO: End 
+    ])
+
+
+@functools.lru_cache(maxsize=None)
+def event_parquet_schema() -> pa.Schema:
+    """
+    Schema của file parquet ở gold-zone, có thêm các cột partition
+    """
+    import pyarrow as pa
+
+    return pa.schema([
+        ("event_id", pa.string()),
+        ("event_type", pa.string()),
+        ("timestamp", pa.timestamp("ms")),
+        ("user_id", pa.int32()),
+        ("year", pa.int32()),
+        ("month", pa.int32()),
+        ("day", pa.int32()),
+        ("location", pa.string()),
+        ("device", pa.string()),
+        ("ip_address", pa.string()),
+        ("event_attribute", pa.list_(
+            pa.struct([
+                ("key", pa.string()),
+                ("int_value", pa.int32()),
+                ("float_value", pa.float32()),
+                ("string_value", pa.string()),
+                ("bool_value", pa.bool_())
+            ])
+        )),
+    ])
+
+
+def list_file_in_bucket(bucket_name: str,
+                        prefix: str,
+                        backend: Optional[StorageBackend] = None) -> List[storage.Blob]:
     """
     Hàm này dùng để trả về một list các blob
     từ google cloud storage có uri bắt đầu ở dạng
@@ -19,6 +101,7 @@ def list_file_in_bucket(bucket_name: str, prefix: str) -> List[storage.Blob]:
     Args:
         bucket_name (str): Tên bucket
         prefix (str): prefix
+        backend (StorageBackend): Storage backend, mặc định là backend dùng chung của process
 
     Returns:
         List[storage.Blob]: List các blob của bucket google cloud storage
@@ -41,11 +124,13 @@ def list_file_in_bucket(bucket_name: str, prefix: str) -> List[storage.Blob]:
             Blob(blob_name = gs://mmo_adventure/bronze-zone/event/2023/08/09/event.json,...),
         ]
     """
-    storage_client = storage.Client()
+    backend = backend or get_storage_backend()
     list_file = []
     # TODO BEGIN CODE
-    for blob in storage_client.list_blobs(bucket_name,prefix=prefix):
-        list_file.append(blob)
+    with stage("list_blobs") as metrics:
+        for blob in backend.list_blobs(bucket_name,prefix=prefix):
+            list_file.append(blob)
+        metrics.rows += len(list_file)
     # TODO END
     return list_file
 
@@ -155,11 +240,104 @@ def _transform_event_attribute(event: dict) -> list:
     return transformed_data
 
 
+def transform_event_data(data: bytes, schema: pa.Schema) -> pa.Table:
+    """
+    Parse nội dung json line của một file event,
+    biến đổi event_attribute theo hàm _transform_event_attribute
+    và thêm các cột partition year, month, day
+
+    Args:
+        data (bytes): Nội dung file event (json theo dòng)
+        schema (pa.Schema): Schema của file event json
+
+    Returns:
+        pa.Table: Table có schema event_parquet_schema()
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from pyarrow import json as pj
+
+    parsed_data = []
+    # Tự đo thời gian parse / transform từng dòng, dùng context manager cho mỗi dòng quá tốn
+    parse_seconds = 0.0
+    transform_seconds = 0.0
+    for line in data.decode('utf-8').split("\n"):
+        if line:
+            # convert string json to dict
+            start = time.perf_counter()
+            event=json.loads(line)
+            parsed = time.perf_counter()
+            parsed_data.append({**event,**{"event_attribute":_transform_event_attribute(event["event_attribute"])}})
+            transform_seconds += time.perf_counter() - parsed
+            parse_seconds += parsed - start
+        else: 
+            continue
+    record_stage("parse_json", parse_seconds, rows=len(parsed_data), bytes=len(data))
+    record_stage("transform_event_attribute", transform_seconds, rows=len(parsed_data))
+        
+    ### CONVERT JSON TO TABLE: json lines -> pyarrow.json.read_json(jsonfile, schema) -> table
+    # Convert list dict to json lines
+    with stage("arrow_read_json") as metrics:
+        # Giữ json lines trong bộ nhớ, dùng chung một file tạm sẽ lỗi khi transform song song
+        buffer = io.BytesIO()
+        for item in parsed_data:
+            buffer.write(json.dumps(item).encode("utf-8") + b"\n")
+        buffer.seek(0)
+
+        parse_opt = pj.ParseOptions(
+            explicit_schema = schema
+        )
+        table = pj.read_json(buffer,parse_options=parse_opt)
+        metrics.rows += table.num_rows
+
+    with stage("partition_columns") as metrics:
+        # Chỉ dùng Arrow compute, không cần pandas
+        timestamp = table.column("timestamp").cast(pa.timestamp("ms"))
+        columns = {name: table.column(name) for name in table.column_names}
+        columns["timestamp"] = timestamp
+        columns["year"] = pc.year(timestamp).cast(pa.int32())
+        columns["month"] = pc.month(timestamp).cast(pa.int32())
+        columns["day"] = pc.day(timestamp).cast(pa.int32())
+        parquet_schema = event_parquet_schema()
+        new_table = pa.Table.from_arrays([columns[field.name] for field in parquet_schema], schema=parquet_schema)
+        metrics.rows += new_table.num_rows
+    return new_table
+
+
+def load_event_table_to_parquet(
+    table: pa.Table,
+    bucket_name: str,
+    destination_prefix: str,
+    backend: Optional[StorageBackend] = None,
+) -> None:
+    """
+    Ghi table thành file parquet partition theo year, month, day
+    vào gs://bucket_name/destination_prefix
+
+    Args:
+        table (pa.Table): Table có schema event_parquet_schema()
+        bucket_name (str): Tên bucket
+        destination_prefix (str): prefix
+        backend (StorageBackend): Storage backend, mặc định là backend dùng chung của process
+    """
+    from pyarrow import parquet as pq
+
+    backend = backend or get_storage_backend()
+    with stage("write_to_dataset") as metrics:
+        pq.write_to_dataset(table,
+                                    root_path=backend.dataset_root(bucket_name, destination_prefix),
+                                    partition_cols=['year','month','day'],
+                                    filesystem=backend.arrow_filesystem())
+        metrics.rows += table.num_rows
+        metrics.bytes += table.nbytes
+
+
 def extract_transform_load_event_to_parquet(
     blob: storage.Blob,
     bucket_name: str,
     destination_prefix: str,
     schema: pa.Schema,
+    backend: Optional[StorageBackend] = None,
 ) -> None:
     """
     Hàm này nhận 1 object blob của folder event_info
@@ -177,6 +355,7 @@ def extract_transform_load_event_to_parquet(
         bucket_name (str): Tên bucket
         destination_prefix (str): prefix
         schema (pa.Schema): Schema của file parquet
+        backend (StorageBackend): Storage backend, mặc định là backend dùng chung của process
     Returns:
         None
 
@@ -192,109 +371,213 @@ def extract_transform_load_event_to_parquet(
                 - gs://mmo_adventure/gold-zone/event_info/year=2023/month=8/day=9/something_also_have_timestamp_2023_08_09_12_00_00.parquet
     """
     # TODO: Begin
-    data = blob.download_as_bytes()
-    parsed_data = []
-    for line in data.decode('utf-8').split("\n"):
-        if line:
-            # convert string json to dict
-            event=json.loads(line)
-            parsed_data.append({**event,**{"event_attribute":_transform_event_attribute(event["event_attribute"])}})
-            # attribute_of_line = pd.read_json(line, lines=True).to_dict()["event_attribute"]
-        else: 
-            continue
-        
-    ### CONVERT JSON TO DATAFRAME: tao file json -> create schema -> dung pyarrow.json.read_json(jsonfile, schema) -> table -> table.to_pandas -> dataframe
-    ### CONVERT DATAFRAME to TABLE: pa.Table.from_pandas(df) -> dataframe
-    # Convert list dict to list json  and write file
-    with open("dict_to_json.json", "w",encoding="utf-8") as outfile: 
-        for item in parsed_data:
-            outfile.write(json.dumps(item) + "\n")
+    backend = backend or get_storage_backend()
+    with stage("download") as metrics:
+        data = backend.download_bytes(blob)
+        metrics.bytes += len(data)
+
+    table = transform_event_data(data, schema)
+    load_event_table_to_parquet(table, bucket_name, destination_prefix, backend=backend)
+    # TODO: End
+
 
-    parse_opt = pj.ParseOptions(
-        explicit_schema = schema
+def run_pipelined_etl(
+    blobs: List[storage.Blob],
+    bucket_name: str,
+    destination_prefix: str,
+    schema: pa.Schema,
+    backend: Optional[StorageBackend] = None,
+    **engine_options,
+) -> int:
+    """
+    Giống extract_transform_load_event_to_parquet cho nhiều blob
+    nhưng chạy download / transform / write chồng lên nhau bằng pipeline.run_pipeline
+
+    Args:
+        blobs (List[storage.Blob]): Các blob của folder event_info
+        bucket_name (str): Tên bucket
+        destination_prefix (str): prefix
+        schema (pa.Schema): Schema của file event json
+        backend (StorageBackend): Storage backend, mặc định là backend dùng chung của process
+        engine_options: download_concurrency, transform_workers, write_concurrency, queue_size, executor
+
+    Returns:
+        int: Số blob đã xử lý
+    """
+    import asyncio
+    from batch_job.cloud_run_batch_job.pipeline import run_pipeline
+
+    backend = backend or get_storage_backend()
+    return asyncio.run(run_pipeline(
+        blobs,
+        download=backend.download_bytes,
+        transform=functools.partial(transform_event_data, schema=schema),
+        write=functools.partial(load_event_table_to_parquet,
+                                bucket_name=bucket_name,
+                                destination_prefix=destination_prefix,
+                                backend=backend),
+        **engine_options,
+    ))
+
+
+def run_streaming_etl(
+    source: NotificationSource,
+    bucket_name: str,
+    source_prefix: str,
+    destination_prefix: str,
+    schema: pa.Schema,
+    backend: Optional[StorageBackend] = None,
+    **stream_options,
+) -> int:
+    """
+    Streaming mode: xử lý các object mới ở bronze-zone ngay khi có notification,
+    mỗi micro-batch được ghi thêm (append) vào các partition year/month/day ở gold-zone
+
+    Args:
+        source (NotificationSource): Nguồn notification (pubsub, local hoặc listing)
+        bucket_name (str): Tên bucket
+        source_prefix (str): Prefix của event ở bronze-zone, object khác prefix bị bỏ qua
+        destination_prefix (str): prefix ở gold-zone
+        schema (pa.Schema): Schema của file event json
+        backend (StorageBackend): Storage backend, mặc định là backend dùng chung của process
+        stream_options: max_batch_objects, max_batch_bytes, max_wait_seconds,
+            download_concurrency, idle_timeout, max_attempts, retry_backoff, stop_event, on_batch
+
+    Returns:
+        int: Số object đã xử lý
+    """
+    import pyarrow as pa
+    from batch_job.cloud_run_batch_job.streaming import run_micro_batches
+
+    backend = backend or get_storage_backend()
+
+    def write(tables: List[pa.Table]) -> None:
+        # Một lần ghi cho cả batch để mỗi partition chỉ có thêm một file
+        load_event_table_to_parquet(pa.concat_tables(tables),
+                                    bucket_name=bucket_name,
+                                    destination_prefix=destination_prefix,
+                                    backend=backend)
+
+    return run_micro_batches(
+        source,
+        accept=lambda notification: (notification.bucket_name == bucket_name
+                                     and notification.name.startswith(source_prefix)),
+        download=lambda notification: backend.download_bytes(backend.blob(notification.bucket_name,
+                                                                          notification.name)),
+        transform=functools.partial(transform_event_data, schema=schema),
+        write=write,
+        **stream_options,
     )
-    # How to read json with pyarrow from json string, don't need write file
-    table = pj.read_json("./dict_to_json.json",parse_options=parse_opt)
 
-    # pq.write_table(table,"table.parquet", compression="snappy")
 
-    # How to read parquet from table, don't need write file
-    # pd.read_parquet("./table.parquet",engine = "pyarrow")
+_first_blob_recorded = False
 
-    # Convert Pyarrow sang pandas
-    df = table.to_pandas(types_mapper = pd.ArrowDtype)
-    
-    df['datetime'] = df['timestamp'].str.split(" ").map(lambda x: x[0])
-    df['year'] = df['datetime'].str.split("-").map(lambda x: x[0]).map(int)
-    df['month'] = df['datetime'].str.split("-").map(lambda x: x[1]).map(int)
-    df['day'] = df['datetime'].str.split("-").map(lambda x: x[2]).map(int)
 
-    new_schema = pa.schema([
-        ("event_id", pa.string()),
-        ("event_type", pa.string()),
-        ("timestamp", pa.timestamp("ms")),
-        ("user_id", pa.int32()),
-        ("year", pa.int32()),
-        ("month", pa.int32()),
-        ("day", pa.int32()),
-        ("location", pa.string()),
-        ("device", pa.string()),
-        ("ip_address", pa.string()),
-        ("event_attribute", pa.list_(
-            pa.struct([
-                ("key", pa.string()),
-                ("int_value", pa.int32()),
-                ("float_value", pa.float32()),
-                ("string_value", pa.string()),
-                ("bool_value", pa.bool_())
-            ])
-        )),
-    ])
-    
-    new_table = pa.Table.from_pandas(df, schema=new_schema)
-
-    gcs = pa.fs.GcsFileSystem(anonymous=False)
-    pq.write_to_dataset(new_table,
-                                root_path=f'{bucket_name}/{destination_prefix}',
-                                partition_cols=['year','month','day'],
-                                filesystem=gcs)
-    # TODO: End
+def _record_time_to_first_blob(blob: storage.Blob) -> None:
+    # Thời gian từ lúc process bắt đầu tới khi blob đầu tiên ghi xong (đo cold start)
+    global _first_blob_recorded
+    if not _first_blob_recorded:
+        _first_blob_recorded = True
+        record_stage("time_to_first_blob", seconds_since_process_start())
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="Cloud Run batch job",
+        description="""
+            Chuyển event json từ bronze-zone
+            thành file parquet partition theo year/month/day ở gold-zone
+        """,
+    )
+    parser.add_argument(
+        "--engine",
+        dest="engine",
+        choices=["pipelined", "sequential"],
+        default=None,
+        help="Override ENGINE from .env",
+    )
+    parser.add_argument(
+        "--mode",
+        dest="mode",
+        choices=["batch", "stream"],
+        default=None,
+        help="Override MODE from .env: one-shot batch or continuous micro-batches",
+    )
+    add_instrumentation_arguments(parser)
+    args = parser.parse_args()
+
     DOTENV_FILE = "./.env"
     env_config = Config(RepositoryEnv(DOTENV_FILE))
 
     BUCKET_NAME = env_config.get("BUCKET_NAME")
     SOURCE_PREFIX = env_config.get("EVENT_SOURCE_PREFIX")
     DESTINATION_PREFIX = env_config.get("EVENT_GOLD_ZONE_PREFIX")
-    """
-        Tạo schema
-    """
-    schema = pa.schema([
-    #TODO: Begin 
-        ('event_id', pa.string()),
-        ('event_type', pa.string()),
-        ('timestamp',  pa.string()),
-        ('user_id', pa.int32()),
-        ('location', pa.string()),
-        ('device', pa.string()),
-        ('ip_address', pa.string()),
-        ('event_attribute', pa.list_(pa.struct([
-            ('key', pa.string()),
-            ('int_value', pa.int32()),
-            ('float_value', pa.float32()),
-            ('string_value', pa.string()),
-            ('bool_value', pa.bool_())
-    ])))
-    #TODO: End 
-    ])
+    set_storage_backend(storage_backend_from_config(env_config))
+    ENGINE = args.engine or env_config.get("ENGINE", default="pipelined")
+    MODE = args.mode or env_config.get("MODE", default="batch")
+    schema = event_json_schema()
+
+    with instrumented_run("cloud_run_batch_job",
+                          profile=args.profile,
+                          profile_output=args.profile_output,
+                          metrics_textfile=args.metrics_textfile) as instrumentation:
+        if MODE == "stream":
+            import signal
+            import threading
+            from batch_job.common.notifications import notification_source_from_config
+
+            # Cloud Run gửi SIGTERM trước khi dừng container: xử lý nốt batch đang gom rồi thoát
+            stop_event = threading.Event()
+            signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+            signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+
+            def on_batch(batch) -> None:
+                if args.metrics_textfile:
+                    instrumentation.write_prometheus_textfile(args.metrics_textfile)
 
-    for blob in list_file_in_bucket(bucket_name=BUCKET_NAME, prefix=SOURCE_PREFIX):
-        logger.info(f"Process file {blob.name}")
-        extract_transform_load_event_to_parquet(
-            blob=blob,
-            bucket_name=BUCKET_NAME,
-            destination_prefix=DESTINATION_PREFIX,
-            schema=schema
-        )
\ No newline at end of file
+            run_streaming_etl(
+                notification_source_from_config(env_config, get_storage_backend(), BUCKET_NAME, SOURCE_PREFIX),
+                bucket_name=BUCKET_NAME,
+                source_prefix=SOURCE_PREFIX,
+                destination_prefix=DESTINATION_PREFIX,
+                schema=schema,
+                max_batch_objects=env_config.get("MICRO_BATCH_MAX_OBJECTS", default=100, cast=int),
+                max_batch_bytes=env_config.get("MICRO_BATCH_MAX_BYTES", default=64 * 2**20, cast=int),
+                max_wait_seconds=env_config.get("MICRO_BATCH_MAX_WAIT", default=5, cast=float),
+                download_concurrency=env_config.get("DOWNLOAD_CONCURRENCY", default=8, cast=int),
+                idle_timeout=env_config.get("STREAM_IDLE_TIMEOUT", default=0, cast=float) or None,
+                max_attempts=env_config.get("STREAM_MAX_ATTEMPTS", default=5, cast=int),
+                retry_backoff=env_config.get("STREAM_RETRY_BACKOFF", default=1, cast=float),
+                stop_event=stop_event,
+                on_batch=on_batch,
+            )
+        elif ENGINE == "pipelined":
+            transform_executor = None
+            if args.profile == "sample":
+                # Sampling profiler chỉ thấy thread của process này, không thấy worker process của transform
+                logger.warning("--profile=sample: run transform in threads instead of worker processes")
+                transform_executor = "thread"
+            blobs = list_file_in_bucket(bucket_name=BUCKET_NAME, prefix=SOURCE_PREFIX)
+            run_pipelined_etl(
+                blobs,
+                bucket_name=BUCKET_NAME,
+                destination_prefix=DESTINATION_PREFIX,
+                schema=schema,
+                download_concurrency=env_config.get("DOWNLOAD_CONCURRENCY", default=8, cast=int),
+                transform_workers=env_config.get("TRANSFORM_WORKERS", default=0, cast=int) or None,
+                write_concurrency=env_config.get("WRITE_CONCURRENCY", default=4, cast=int),
+                queue_size=env_config.get("QUEUE_SIZE", default=4, cast=int),
+                executor=transform_executor,
+                on_processed=_record_time_to_first_blob,
+            )
+        else:
+            blobs = list_file_in_bucket(bucket_name=BUCKET_NAME, prefix=SOURCE_PREFIX)
+            for blob in blobs:
+                logger.info(f"Process file {blob.name}")
+                extract_transform_load_event_to_parquet(
+                    blob=blob,
+                    bucket_name=BUCKET_NAME,
+                    destination_prefix=DESTINATION_PREFIX,
+                    schema=schema
+                )
+                _record_time_to_first_blob(blob)
\ No newline at end of file
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from batch_job.common.instrumentation import (
+    StageMetrics,
+    add_profile_stats,
+    call_with_profile,
+    capture_stages,
+    get_instrumentation,
+    profiling_enabled,
+    record_stage,
+    run_profiled,
+)
+
+# Sentinel báo cho worker của stage sau là không còn item
+_DONE = object()
+
+
+def _call_with_captured_stages(func: Callable, profile: bool, *args) -> Tuple[Any, List[StageMetrics], dict]:
+    # Chạy trong worker process: số liệu stage (và cProfile stats khi profile) được trả về để process chính merge
+    with capture_stages() as instrumentation:
+        if profile:
+            result, stats = call_with_profile(func, *args)
+        else:
+            result, stats = func(*args), {}
+    return result, list(instrumentation.stages.values()), stats
+
+
+async def _wait_all(tasks: List[asyncio.Task]) -> None:
+    # Dừng cả pipeline ngay khi một stage lỗi thay vì đợi các stage khác bị treo ở queue
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    for task in done:
+        task.result()
+
+
+async def run_pipeline(blobs: Iterable,
+                       download: Callable[[Any], bytes],
+                       transform: Callable[[bytes], Any],
+                       write: Callable[[Any], None],
+                       download_concurrency: int = 8,
+                       transform_workers: Optional[int] = None,
+                       write_concurrency: int = 4,
+                       queue_size: int = 4,
+                       executor: Optional[str] = None,
+                       on_processed: Optional[Callable[[Any], None]] = None) -> int:
+    """
+    Chạy download -> transform -> write theo kiểu pipeline:
+    trong lúc transform blob hiện tại thì các blob sau đang được download
+    và các table trước đang được ghi.
+
+        blobs --download (thread)--> [transform_queue] --transform (process)--> [write_queue] --write (thread)-->
+
+    Các queue có kích thước queue_size nên khi stage sau chậm thì stage trước sẽ dừng lại (backpressure).
+    Số object nằm trong bộ nhớ tối đa khoảng:
+        download_concurrency + queue_size file json,
+        transform_workers + queue_size + write_concurrency table
+
+    Khi run đang bật cProfile (--profile), các lần gọi download / transform / write
+    được profile trong thread / process của executor và cộng vào profile của run.
+
+    Args:
+        blobs (Iterable): Các blob cần xử lý
+        download (Callable): blob -> bytes
+        transform (Callable): bytes -> table, phải pickle được nếu executor = "process"
+        write (Callable): table -> None
+        download_concurrency (int): Số download chạy đồng thời
+        transform_workers (int): Số worker transform, mặc định là số CPU
+        write_concurrency (int): Số write chạy đồng thời
+        queue_size (int): Kích thước mỗi queue giữa 2 stage
+        executor (str): "process" (transform song song trên nhiều CPU) hoặc "thread",
+            mặc định là "process" khi có nhiều hơn 1 transform worker
+        on_processed (Callable): Được gọi với blob sau khi blob đó ghi xong
+
+
+    Returns:
+        int: Số blob đã xử lý
+    """
+    transform_workers = transform_workers or os.cpu_count() or 1
+    # Với 1 worker, process pool chỉ tốn thêm thời gian spawn và pickle
+    executor = executor or ("process" if transform_workers > 1 else "thread")
+    loop = asyncio.get_running_loop()
+    transform_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    write_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    blob_iterator = iter(blobs)
+    processed = 0
+
+    io_executor = ThreadPoolExecutor(max_workers=download_concurrency + write_concurrency,
+                                     thread_name_prefix="pipeline-io")
+    if executor == "process":
+        cpu_executor: Executor = ProcessPoolExecutor(max_workers=transform_workers, mp_context=get_context("spawn"))
+    elif executor == "thread":
+        cpu_executor = ThreadPoolExecutor(max_workers=transform_workers, thread_name_prefix="pipeline-transform")
+    else:
+        raise ValueError(f"Unknown executor: {executor}")
+
+    async def downloader() -> None:
+        # Các downloader dùng chung một iterator, an toàn vì chỉ chạy trên event loop
+        for blob in blob_iterator:
+            start = time.perf_counter()
+            data = await loop.run_in_executor(io_executor, run_profiled, download, blob)
+            record_stage("download", time.perf_counter() - start, bytes=len(data))
+            await transform_queue.put((blob, data))
+
+    async def transformer() -> None:
+        while True:
+            item = await transform_queue.get()
+            if item is _DONE:
+                return
+            blob, data = item
+            if executor == "process":
+                table, stages, stats = await loop.run_in_executor(cpu_executor, _call_with_captured_stages,
+                                                                  transform, profiling_enabled(), data)
+                get_instrumentation().merge(stages)
+                add_profile_stats(stats)
+            else:
+                table = await loop.run_in_executor(cpu_executor, run_profiled, transform, data)
+            del data
+            await write_queue.put((blob, table))
+
+    async def writer() -> None:
+        nonlocal processed
+        while True:
+            item = await write_queue.get()
+            if item is _DONE:
+                return
+            blob, table = item
+            await loop.run_in_executor(io_executor, run_profiled, write, table)
+            processed += 1
+            logger.info(f"Processed file {blob.name}")
+            if on_processed is not None:
+                on_processed(blob)
+
+    async def run_stage(workers: List[Callable], next_queue: Optional[asyncio.Queue], next_workers: int) -> None:
+        await _wait_all([asyncio.ensure_future(worker()) for worker in workers])
+        if next_queue is not None:
+            for _ in range(next_workers):
+                await next_queue.put(_DONE)
+
+    try:
+        await _wait_all([
+            asyncio.ensure_future(run_stage([downloader] * download_concurrency, transform_queue, transform_workers)),
+            asyncio.ensure_future(run_stage([transformer] * transform_workers, write_queue, write_concurrency)),
+            asyncio.ensure_future(run_stage([writer] * write_concurrency, None, 0)),
+        ])
+    finally:
+        io_executor.shutdown(wait=True)
+        cpu_executor.shutdown(wait=True)
+    return processed
@@ -0,0 +1,206 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from batch_job.common.instrumentation import record_stage, run_profiled, stage
+from batch_job.common.notifications import NotificationSource, ObjectNotification
+
+
+class MicroBatcher:
+    """
+    Gom notification thành micro-batch.
+    Batch sẵn sàng khi đủ max_objects object, đủ max_bytes bytes
+    hoặc object đầu tiên của batch đã đợi quá max_wait_seconds.
+
+    Args:
+        max_objects (int): Số object tối đa của một batch
+        max_bytes (int): Tổng kích thước (bytes) tối đa của một batch
+        max_wait_seconds (float): Thời gian tối đa một object nằm chờ trong batch
+        clock (Callable): Hàm trả về thời gian hiện tại (giây), dùng để test
+    """
+
+    def __init__(self,
+                 max_objects: int = 100,
+                 max_bytes: int = 64 * 2**20,
+                 max_wait_seconds: float = 5.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_objects = max_objects
+        self.max_bytes = max_bytes
+        self.max_wait_seconds = max_wait_seconds
+        self.clock = clock
+        self.pending: List[ObjectNotification] = []
+        self.pending_bytes = 0
+        self._first_added_at: Optional[float] = None
+
+    def add(self, notification: ObjectNotification) -> None:
+        if not self.pending:
+            self._first_added_at = self.clock()
+        self.pending.append(notification)
+        self.pending_bytes += notification.size
+
+    def time_left(self) -> float:
+        """
+        Số giây còn lại trước khi batch hiện tại phải được xử lý (inf nếu batch rỗng)
+        """
+        if not self.pending:
+            return float("inf")
+        return max(0.0, self._first_added_at + self.max_wait_seconds - self.clock())
+
+    def ready(self) -> bool:
+        return bool(self.pending) and (
+            len(self.pending) >= self.max_objects
+            or self.pending_bytes >= self.max_bytes
+            or self.time_left() <= 0
+        )
+
+    def drain(self) -> List[ObjectNotification]:
+        batch = self.pending
+        self.pending = []
+        self.pending_bytes = 0
+        self._first_added_at = None
+        return batch
+
+
+def run_micro_batches(source: NotificationSource,
+                      accept: Callable[[ObjectNotification], bool],
+                      download: Callable[[ObjectNotification], bytes],
+                      transform: Callable[[bytes], Any],
+                      write: Callable[[List[Any]], None],
+                      max_batch_objects: int = 100,
+                      max_batch_bytes: int = 64 * 2**20,
+                      max_wait_seconds: float = 5.0,
+                      download_concurrency: int = 8,
+                      poll_timeout: float = 1.0,
+                      idle_timeout: Optional[float] = None,
+                      max_attempts: int = 5,
+                      retry_backoff: float = 1.0,
+                      max_retry_backoff: float = 60.0,
+                      stop_event: Optional[threading.Event] = None,
+                      on_batch: Optional[Callable[[List[ObjectNotification]], None]] = None) -> int:
+    """
+    Chạy liên tục: lấy notification từ source, gom thành micro-batch (MicroBatcher)
+    rồi download -> transform từng object -> write các object thành công một lần.
+    Notification chỉ được ack sau khi write xong (at-least-once, một object có thể được ghi lại
+    nếu job dừng giữa write và ack). Object lỗi (hoặc cả batch nếu write lỗi) được nack
+    để giao lại sau retry_backoff * 2^(lần thử - 1) giây, lỗi max_attempts lần thì được
+    chuyển sang dead letter để không chặn các object khác.
+
+    Args:
+        source (NotificationSource): Nguồn notification
+        accept (Callable): notification -> bool, notification không được nhận sẽ được ack và bỏ qua
+        download (Callable): notification -> bytes
+        transform (Callable): bytes -> table
+        write (Callable): list table của batch -> None
+        max_batch_objects (int): Số object tối đa của một batch
+        max_batch_bytes (int): Tổng kích thước tối đa của một batch
+        max_wait_seconds (float): Độ trễ tối đa từ lúc nhận notification tới lúc xử lý batch
+        download_concurrency (int): Số download chạy đồng thời trong một batch
+        poll_timeout (float): Thời gian tối đa mỗi lần đợi source
+        idle_timeout (float): Dừng khi không có notification nào trong idle_timeout giây, None là chạy mãi
+        max_attempts (int): Số lần thử tối đa của một object trước khi chuyển sang dead letter
+        retry_backoff (float): Thời gian đợi (giây) trước lần giao lại đầu tiên, gấp đôi sau mỗi lần lỗi
+        max_retry_backoff (float): Thời gian đợi tối đa trước một lần giao lại
+        stop_event (threading.Event): Set để dừng (ví dụ khi nhận SIGTERM), batch đang gom sẽ được xử lý trước khi dừng
+        on_batch (Callable): Được gọi với các notification của batch sau khi batch ghi xong
+
+    Returns:
+        int: Số object đã xử lý
+    """
+    stop_event = stop_event or threading.Event()
+    batcher = MicroBatcher(max_objects=max_batch_objects,
+                           max_bytes=max_batch_bytes,
+                           max_wait_seconds=max_wait_seconds)
+    processed = 0
+    last_received = time.monotonic()
+    # Số lần thử của các object đang lỗi, theo (bucket, name)
+    attempts: Dict[Tuple[str, str], int] = {}
+
+    def retry_or_dead_letter(failed: List[ObjectNotification]) -> None:
+        for notification in failed:
+            key = (notification.bucket_name, notification.name)
+            attempt = max(attempts.get(key, 0) + 1, notification.delivery_attempt)
+            if attempt >= max_attempts:
+                logger.error(f"{notification.name} failed {attempt} times, move to dead letter")
+                attempts.pop(key, None)
+                source.dead_letter([notification])
+                record_stage("dead_letter", 0.0, rows=1)
+            else:
+                attempts[key] = attempt
+                source.nack([notification], delay=min(retry_backoff * 2 ** (attempt - 1), max_retry_backoff))
+
+    def process(batch: List[ObjectNotification]) -> None:
+        nonlocal processed
+        written: List[ObjectNotification] = []
+        failed: List[ObjectNotification] = []
+        with stage("micro_batch") as metrics:
+            tables = []
+            for notification, future in [(notification, executor.submit(run_profiled, download, notification))
+                                         for notification in batch]:
+                try:
+                    data = future.result()
+                    metrics.bytes += len(data)
+                    tables.append(transform(data))
+                    del data
+                except Exception:
+                    logger.exception(f"Failed to process {notification.name}")
+                    failed.append(notification)
+                    continue
+                written.append(notification)
+            if tables:
+                try:
+                    write(tables)
+                    metrics.rows += sum(table.num_rows for table in tables)
+                except Exception:
+                    logger.exception(f"Failed to write micro-batch of {len(tables)} objects")
+                    failed += written
+                    written = []
+
+        if failed:
+            retry_or_dead_letter(failed)
+        if not written:
+            return
+        source.ack(written)
+        processed += len(written)
+        for notification in written:
+            attempts.pop((notification.bucket_name, notification.name), None)
+
+        # Độ trễ từ lúc object được ghi vào bronze-zone tới lúc có trong gold-zone
+        now = time.time()
+        lags = [now - notification.created_at for notification in written if notification.created_at is not None]
+        for lag in lags:
+            record_stage("arrival_to_gold", lag)
+        logger.info(
+            f"Processed micro-batch of {len(written)} objects"
+            + (f", {len(failed)} failed" if failed else "")
+            + (f", max arrival to gold {max(lags):.2f}s" if lags else "")
+        )
+        if on_batch is not None:
+            on_batch(written)
+
+    executor = ThreadPoolExecutor(max_workers=download_concurrency, thread_name_prefix="stream-download")
+    try:
+        while not stop_event.is_set():
+            timeout = min(poll_timeout, batcher.time_left())
+            notifications = source.pull(max_messages=max_batch_objects - len(batcher.pending), timeout=timeout)
+            if notifications:
+                last_received = time.monotonic()
+            for notification in notifications:
+                if accept(notification):
+                    batcher.add(notification)
+                else:
+                    source.ack([notification])
+            if batcher.ready():
+                process(batcher.drain())
+            elif not batcher.pending and idle_timeout is not None \
+                    and time.monotonic() - last_received >= idle_timeout:
+                logger.info(f"No notification for {idle_timeout}s, stop streaming")
+                break
+        if batcher.pending:
+            process(batcher.drain())
+    finally:
+        executor.shutdown(wait=True)
+        source.close()
+    return processed
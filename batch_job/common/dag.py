@@ -0,0 +1,228 @@
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from loguru import logger
+
+from batch_job.common.instrumentation import record_stage
+
+
+@dataclass
+class Step:
+    """
+    Một bước của pipeline, chỉ chạy khi các bước trong depends_on đã xong
+
+    Args:
+        name (str): Tên bước, duy nhất trong DAG
+        run (Callable): Hàm chạy bước, raise exception nếu lỗi
+        depends_on (List[str]): Tên các bước phải xong trước
+    """
+    name: str
+    run: Callable[[], None]
+    depends_on: List[str] = field(default_factory=list)
+
+
+def command_step(name: str,
+                 command: List[str],
+                 cwd: Optional[str] = None,
+                 env: Optional[Dict[str, str]] = None,
+                 depends_on: Optional[List[str]] = None) -> Step:
+    """
+    Tạo Step chạy một command (ví dụ một job hoặc lệnh gcloud) trong process riêng
+
+    Args:
+        name (str): Tên bước
+        command (List[str]): Command và các tham số
+        cwd (str): Thư mục chạy command
+        env (Dict[str, str]): Biến môi trường thêm vào / ghi đè môi trường hiện tại
+        depends_on (List[str]): Tên các bước phải xong trước
+    """
+    def run() -> None:
+        logger.info(f"[{name}] {' '.join(command)}")
+        subprocess.run(command, cwd=cwd, env={**os.environ, **(env or {})}, check=True)
+
+    return Step(name=name, run=run, depends_on=list(depends_on or []))
+
+
+def topological_order(steps: List[Step]) -> List[Step]:
+    """
+    Sắp xếp các bước sao cho mỗi bước đứng sau các bước nó phụ thuộc.
+    Raise ValueError nếu có bước trùng tên, phụ thuộc không tồn tại hoặc vòng lặp.
+    """
+    by_name: Dict[str, Step] = {}
+    for step in steps:
+        if step.name in by_name:
+            raise ValueError(f"Duplicate step: {step.name}")
+        by_name[step.name] = step
+    for step in steps:
+        for dependency in step.depends_on:
+            if dependency not in by_name:
+                raise ValueError(f"Step {step.name} depends on unknown step {dependency}")
+
+    ordered: List[Step] = []
+    # 0 = chưa thăm, 1 = đang thăm, 2 = đã xong
+    visit_state: Dict[str, int] = {}
+
+    def visit(step: Step, path: List[str]) -> None:
+        state = visit_state.get(step.name, 0)
+        if state == 2:
+            return
+        if state == 1:
+            raise ValueError(f"Cycle in DAG: {' -> '.join(path + [step.name])}")
+        visit_state[step.name] = 1
+        for dependency in step.depends_on:
+            visit(by_name[dependency], path + [step.name])
+        visit_state[step.name] = 2
+        ordered.append(step)
+
+    for step in steps:
+        visit(step, [])
+    return ordered
+
+
+def critical_path(steps: List[Step], durations: Dict[str, float]) -> List[str]:
+    """
+    Đường đi dài nhất (tính theo durations) qua DAG,
+    là thời gian chạy tối thiểu nếu không giới hạn số bước chạy đồng thời
+    """
+    finish: Dict[str, float] = {}
+    previous: Dict[str, Optional[str]] = {}
+    for step in topological_order(steps):
+        start, before = 0.0, None
+        for dependency in step.depends_on:
+            if finish[dependency] > start:
+                start, before = finish[dependency], dependency
+        finish[step.name] = start + durations.get(step.name, 0.0)
+        previous[step.name] = before
+
+    if not finish:
+        return []
+    path = [max(finish, key=finish.get)]
+    while previous[path[-1]] is not None:
+        path.append(previous[path[-1]])
+    return list(reversed(path))
+
+
+class StepFailed(Exception):
+    pass
+
+
+class DagRunner:
+    """
+    Chạy các Step theo DAG: bước nào đủ phụ thuộc thì chạy ngay,
+    tối đa max_workers bước cùng lúc.
+
+    Bước chạy xong được ghi vào state_path (json), lần chạy sau sẽ bỏ qua các bước này
+    nên một lần chạy lỗi có thể chạy tiếp từ bước bị lỗi. State được xoá khi chạy xong tất cả các bước.
+    State chỉ được dùng lại khi fingerprint (tham số của lần chạy và tên các bước) giống lần trước,
+    khác thì chạy lại từ đầu.
+    Khi một bước lỗi thì không chạy thêm bước mới, đợi các bước đang chạy xong rồi raise StepFailed.
+    Thời gian mỗi bước được ghi vào instrumentation của job (record_stage).
+
+    Args:
+        steps (List[Step]): Các bước của pipeline
+        state_path (str): File lưu các bước đã xong, None thì không lưu
+        max_workers (int): Số bước chạy đồng thời tối đa
+        fingerprint (dict): Tham số của lần chạy (ví dụ target, data path), được so với state đã lưu
+
+    Ví dụ:
+        runner = DagRunner([
+            Step("upload", upload),
+            Step("build", build),
+            Step("process", process, depends_on=["upload", "build"]),
+        ], state_path="./pipeline_state.json", fingerprint={"data_path": "./data"})
+        runner.run()
+    """
+
+    def __init__(self,
+                 steps: List[Step],
+                 state_path: Optional[str] = None,
+                 max_workers: int = 4,
+                 fingerprint: Optional[dict] = None):
+        self.steps = topological_order(steps)
+        self.state_path = state_path
+        self.max_workers = max_workers
+        self.fingerprint = {**(fingerprint or {}), "steps": sorted(step.name for step in self.steps)}
+        self.completed: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        if state_path and os.path.exists(state_path):
+            with open(state_path, encoding="utf-8") as infile:
+                state = json.load(infile)
+            if state.get("fingerprint") == self.fingerprint:
+                self.completed = state.get("completed", {})
+            else:
+                logger.info(f"State {state_path} is from a different run ({state.get('fingerprint')}), start over")
+                self.reset()
+
+    def reset(self) -> None:
+        """
+        Bỏ state của lần chạy trước, chạy lại tất cả các bước
+        """
+        self.completed = {}
+        if self.state_path and os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def _save_state(self) -> None:
+        if not self.state_path:
+            return
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as outfile:
+            json.dump({"fingerprint": self.fingerprint, "completed": self.completed}, outfile, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+    def _run_step(self, step: Step) -> float:
+        start = time.perf_counter()
+        step.run()
+        duration = time.perf_counter() - start
+        record_stage(step.name, duration)
+        with self._lock:
+            self.completed[step.name] = {"duration_seconds": round(duration, 3), "finished_at": time.time()}
+            self._save_state()
+        logger.info(f"[{step.name}] done in {duration:.1f}s")
+        return duration
+
+    def run(self) -> Dict[str, float]:
+        """
+        Chạy các bước chưa xong
+
+        Returns:
+            Dict[str, float]: Thời gian chạy (giây) của các bước đã chạy trong lần này
+        """
+        skipped = [step.name for step in self.steps if step.name in self.completed]
+        if skipped:
+            logger.info(f"Resume, skip completed steps: {', '.join(skipped)}")
+        pending = [step for step in self.steps if step.name not in self.completed]
+        running: Dict[Future, Step] = {}
+        durations: Dict[str, float] = {}
+        failures: List[str] = []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dag-step") as executor:
+            while pending or running:
+                if not failures:
+                    for step in list(pending):
+                        if len(running) >= self.max_workers:
+                            break
+                        if all(dependency in self.completed for dependency in step.depends_on):
+                            pending.remove(step)
+                            running[executor.submit(self._run_step, step)] = step
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    try:
+                        durations[step.name] = future.result()
+                    except Exception as error:
+                        logger.error(f"[{step.name}] failed: {error}")
+                        failures.append(step.name)
+
+        if failures:
+            raise StepFailed(f"Failed steps: {', '.join(failures)}, rerun to resume from them")
+        if self.state_path and os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        return durations
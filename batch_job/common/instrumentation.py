@@ -0,0 +1,482 @@
+import argparse
+import collections
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from loguru import logger
+
+try:
+    import resource
+except ImportError:  # Windows không có module resource
+    resource = None
+
+
+def peak_rss_bytes(include_children: bool = False) -> int:
+    """
+    Trả về peak RSS (bytes) của process hiện tại.
+    Linux trả ru_maxrss theo KB, macOS trả theo bytes.
+
+    Args:
+        include_children (bool): Cộng thêm peak RSS lớn nhất của các process con đã kết thúc
+            (ví dụ worker của ProcessPoolExecutor)
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if include_children:
+        peak += resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
+
+
+_IMPORTED_AT = time.perf_counter()
+
+
+def seconds_since_process_start() -> float:
+    """
+    Số giây từ lúc process bắt đầu (tính cả khởi động interpreter và import).
+    Linux: dựa vào starttime trong /proc/self/stat,
+    hệ điều hành khác: tính từ lúc import module này.
+    """
+    try:
+        with open("/proc/self/stat", encoding="utf-8") as infile:
+            stat = infile.read()
+        # Tên process (field 2) có thể chứa dấu cách, starttime là field 22
+        start_ticks = int(stat.rsplit(")", 1)[1].split()[19])
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, AttributeError, ValueError, IndexError):
+        return time.perf_counter() - _IMPORTED_AT
+
+
+# Cloud Logging chỉ đổi tên level này khi đọc field severity
+_SEVERITY = {"TRACE": "DEBUG", "SUCCESS": "INFO"}
+_logging_configured = False
+
+
+def log_structured(level: str, record: dict) -> None:
+    """
+    Log record (dict) thành một dòng JSON riêng sau khi configure_logging,
+    Cloud Logging lưu thành jsonPayload thay vì textPayload
+    """
+    logger.bind(structured=record).log(level, record.get("event", ""))
+
+
+def _write_structured(message) -> None:
+    record = message.record
+    sys.stderr.write(json.dumps({
+        "severity": _SEVERITY.get(record["level"].name, record["level"].name),
+        "time": record["time"].isoformat(),
+        "message": record["message"],
+        **record["extra"]["structured"],
+    }) + "\n")
+
+
+def configure_logging() -> None:
+    """
+    Cấu hình loguru cho job: log thường vẫn là dòng text như mặc định,
+    record của log_structured (stage, job summary) là dòng JSON không có prefix.
+    Level lấy từ LOGURU_LEVEL (mặc định DEBUG như loguru), stage log ở mức TRACE.
+    """
+    global _logging_configured
+    if _logging_configured:
+        return
+    _logging_configured = True
+    level = os.environ.get("LOGURU_LEVEL", "DEBUG")
+    try:
+        logger.remove(0)
+    except ValueError:  # handler mặc định đã bị bỏ
+        pass
+    logger.add(sys.stderr, level=level, filter=lambda record: "structured" not in record["extra"])
+    logger.add(_write_structured, level=level, filter=lambda record: "structured" in record["extra"])
+
+
+@dataclass
+class StageMetrics:
+    """
+    Số liệu cộng dồn của một stage trong job
+    """
+    name: str
+    calls: int = 0
+    duration_seconds: float = 0.0
+    rows: int = 0
+    bytes: int = 0
+    peak_rss_bytes: int = 0
+
+
+class Instrumentation:
+    """
+    Ghi lại thời gian, số dòng, số bytes và peak RSS theo từng stage của một job.
+
+    Ví dụ:
+        instrumentation = Instrumentation("upload_event")
+        with instrumentation.stage("upload") as metrics:
+            blob.upload_from_filename(file_path)
+            metrics.bytes += os.path.getsize(file_path)
+    """
+
+    def __init__(self, job_name: str):
+        self.job_name = job_name
+        self.stages: Dict[str, StageMetrics] = {}
+        self.started_at = time.perf_counter()
+        self.duration_seconds = 0.0
+        self.success = False
+        # Các stage có thể được ghi từ nhiều thread (pipeline engine)
+        self._lock = threading.Lock()
+
+    def _get_stage(self, name: str) -> StageMetrics:
+        if name not in self.stages:
+            self.stages[name] = StageMetrics(name=name)
+        return self.stages[name]
+
+    def record(self, name: str, duration_seconds: float, rows: int = 0, bytes: int = 0) -> StageMetrics:
+        """
+        Cộng dồn số liệu cho stage `name`.
+        Dùng khi đã tự đo thời gian (ví dụ trong vòng lặp từng dòng)
+        để tránh overhead của context manager.
+        """
+        peak = peak_rss_bytes()
+        with self._lock:
+            metrics = self._get_stage(name)
+            metrics.calls += 1
+            metrics.duration_seconds += duration_seconds
+            metrics.rows += rows
+            metrics.bytes += bytes
+            metrics.peak_rss_bytes = max(metrics.peak_rss_bytes, peak)
+        return metrics
+
+    def merge(self, stages: Iterable[StageMetrics]) -> None:
+        """
+        Cộng dồn số liệu ghi ở process khác (ví dụ worker của ProcessPoolExecutor)
+        """
+        with self._lock:
+            for other in stages:
+                metrics = self._get_stage(other.name)
+                metrics.calls += other.calls
+                metrics.duration_seconds += other.duration_seconds
+                metrics.rows += other.rows
+                metrics.bytes += other.bytes
+                metrics.peak_rss_bytes = max(metrics.peak_rss_bytes, other.peak_rss_bytes)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageMetrics]:
+        """
+        Đo thời gian của block code bên trong.
+        Object trả về dùng để cộng thêm rows / bytes cho lần gọi này.
+        """
+        current = StageMetrics(name=name)
+        start = time.perf_counter()
+        try:
+            yield current
+        finally:
+            duration = time.perf_counter() - start
+            metrics = self.record(name, duration, rows=current.rows, bytes=current.bytes)
+            # Mỗi lần gọi một dòng (nhiều dòng cho mỗi blob) nên ở mức TRACE, chỉ hiện khi LOGURU_LEVEL=TRACE
+            log_structured("TRACE", {
+                "event": "stage",
+                "job": self.job_name,
+                "stage": name,
+                "duration_seconds": round(duration, 6),
+                "rows": current.rows,
+                "bytes": current.bytes,
+                "peak_rss_bytes": metrics.peak_rss_bytes,
+            })
+
+    def finish(self, success: bool) -> None:
+        self.duration_seconds = time.perf_counter() - self.started_at
+        self.success = success
+
+    def summary(self) -> dict:
+        return {
+            "event": "job_summary",
+            "job": self.job_name,
+            "success": self.success,
+            "duration_seconds": round(self.duration_seconds, 6),
+            "peak_rss_bytes": peak_rss_bytes(),
+            "stages": [asdict(metrics) for metrics in self.stages.values()],
+        }
+
+    def log_summary(self) -> None:
+        log_structured("INFO", self.summary())
+
+    def to_prometheus(self) -> str:
+        """
+        Xuất số liệu theo định dạng text của Prometheus
+        (dùng cho textfile collector của node_exporter)
+        """
+        job = self.job_name
+        lines = []
+
+        def gauge(metric: str, help_text: str, samples: list) -> None:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{metric}{{{label_text}}} {value}")
+
+        stage_fields = [
+            ("calls", "Number of times the stage ran"),
+            ("duration_seconds", "Total wall time spent in the stage"),
+            ("rows", "Rows processed by the stage"),
+            ("bytes", "Bytes processed by the stage"),
+            ("peak_rss_bytes", "Process peak RSS observed at the end of the stage"),
+        ]
+        for field, help_text in stage_fields:
+            gauge(
+                f"batch_job_stage_{field}",
+                help_text,
+                [({"job": job, "stage": m.name}, getattr(m, field)) for m in self.stages.values()],
+            )
+        gauge("batch_job_duration_seconds", "Wall time of the last run",
+              [({"job": job}, round(self.duration_seconds, 6))])
+        gauge("batch_job_success", "1 if the last run succeeded",
+              [({"job": job}, int(self.success))])
+        gauge("batch_job_peak_rss_bytes", "Process peak RSS of the last run",
+              [({"job": job}, peak_rss_bytes())])
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus_textfile(self, path: str) -> None:
+        # Ghi ra file tạm rồi rename để collector không đọc phải file ghi dở
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as outfile:
+            outfile.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+
+class SamplingProfiler:
+    """
+    Sampling profiler đơn giản: định kỳ chụp stack của tất cả thread
+    và đếm theo dạng "folded stacks" (đọc được bằng flamegraph.pl / speedscope).
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def dump(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as outfile:
+            for stack, count in self.samples.most_common():
+                outfile.write(f"{stack} {count}\n")
+
+
+_current: Optional[Instrumentation] = None
+
+
+def get_instrumentation() -> Instrumentation:
+    """
+    Trả về Instrumentation của job đang chạy.
+    Nếu chưa có (ví dụ khi gọi hàm từ test) thì tạo một instance mặc định.
+    """
+    global _current
+    if _current is None:
+        _current = Instrumentation(job_name="default")
+    return _current
+
+
+def stage(name: str):
+    return get_instrumentation().stage(name)
+
+
+def record_stage(name: str, duration_seconds: float, rows: int = 0, bytes: int = 0) -> StageMetrics:
+    return get_instrumentation().record(name, duration_seconds, rows=rows, bytes=bytes)
+
+
+# cProfile của run chỉ đo thread đã bật nó (trước Python 3.12),
+# các hàm chạy trong thread / process khác được profile riêng rồi cộng vào đây
+_profile_lock = threading.Lock()
+_worker_profile_stats: Optional[pstats.Stats] = None
+_profiler_thread_id: Optional[int] = None
+
+
+class _RawStats:
+    # pstats.Stats.add nhận object có create_stats() và stats
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+def add_profile_stats(stats: Optional[dict]) -> None:
+    """
+    Cộng stats của cProfile (Profile.stats, ví dụ trả về từ worker process) vào profile của run
+    """
+    with _profile_lock:
+        if stats and _worker_profile_stats is not None:
+            _worker_profile_stats.add(_RawStats(stats))
+
+
+def call_with_profile(func: Callable, *args) -> Tuple[Any, dict]:
+    """
+    Chạy func dưới một cProfile riêng, trả về kết quả và stats (pickle được)
+    để process chính cộng vào profile của run bằng add_profile_stats
+    """
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+: profiler của run đã đo mọi thread của process này
+        return func(*args), {}
+    try:
+        result = func(*args)
+    finally:
+        profiler.disable()
+    profiler.create_stats()
+    return result, profiler.stats
+
+
+def profiling_enabled() -> bool:
+    """
+    True khi run đang chạy với --profile=cprofile
+    """
+    return _worker_profile_stats is not None
+
+
+def run_profiled(func: Callable, *args) -> Any:
+    """
+    Gọi func(*args); khi run đang bật cProfile mà đang ở thread khác thread đã bật profiler
+    (ví dụ thread của executor) thì profile lần gọi này và cộng vào profile của run
+    """
+    if _worker_profile_stats is None or threading.get_ident() == _profiler_thread_id:
+        return func(*args)
+    result, stats = call_with_profile(func, *args)
+    add_profile_stats(stats)
+    return result
+
+
+@contextmanager
+def capture_stages() -> Iterator[Instrumentation]:
+    """
+    Ghi các stage vào một Instrumentation tạm thay vì của job, không log summary.
+    Dùng trong worker process để trả số liệu về cho process chính (Instrumentation.merge).
+    """
+    global _current
+    instrumentation = Instrumentation(job_name="worker")
+    previous, _current = _current, instrumentation
+    try:
+        yield instrumentation
+    finally:
+        _current = previous
+
+
+def add_instrumentation_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        nargs="?",
+        const="cprofile",
+        choices=["cprofile", "sample"],
+        default=None,
+        help="Capture a cProfile (default) or sampling profile of the run",
+    )
+    parser.add_argument(
+        "--profile-output",
+        dest="profile_output",
+        default=None,
+        help="Profile output path (default: ./<job>.prof or ./<job>.folded)",
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        dest="metrics_textfile",
+        default=None,
+        help="Write stage metrics to this Prometheus textfile",
+    )
+
+
+@contextmanager
+def instrumented_run(job_name: str,
+                     profile: Optional[str] = None,
+                     profile_output: Optional[str] = None,
+                     metrics_textfile: Optional[str] = None) -> Iterator[Instrumentation]:
+    """
+    Bọc toàn bộ một lần chạy job:
+        - Tạo Instrumentation dùng chung cho các hàm stage() / record_stage()
+        - Bật profiler nếu có `profile` ("cprofile" hoặc "sample").
+          cProfile chỉ đo thread hiện tại, hàm chạy trong executor cần gọi qua run_profiled
+          (thread) hoặc call_with_profile + add_profile_stats (process) để có trong profile
+        - Cấu hình log (configure_logging)
+        - Khi kết thúc: log summary thành một dòng JSON, ghi Prometheus textfile và file profile
+
+    Args:
+        job_name (str): Tên job, dùng làm label
+        profile (str): None, "cprofile" hoặc "sample"
+        profile_output (str): Đường dẫn file profile
+        metrics_textfile (str): Đường dẫn Prometheus textfile
+    """
+    global _current, _worker_profile_stats, _profiler_thread_id
+    configure_logging()
+    instrumentation = Instrumentation(job_name)
+    previous, _current = _current, instrumentation
+
+    profiler = None
+    if profile == "cprofile":
+        profiler = cProfile.Profile()
+        _worker_profile_stats = pstats.Stats()
+        _profiler_thread_id = threading.get_ident()
+        profiler.enable()
+    elif profile == "sample":
+        profiler = SamplingProfiler()
+        profiler.start()
+
+    success = False
+    try:
+        yield instrumentation
+        success = True
+    finally:
+        if profile == "cprofile":
+            profiler.disable()
+            with _profile_lock:
+                stats = pstats.Stats(profiler)
+                # Cộng thêm các hàm chạy trong thread / process của executor
+                stats.add(_worker_profile_stats)
+                _worker_profile_stats, _profiler_thread_id = None, None
+            output = profile_output or f"./{job_name}.prof"
+            stats.dump_stats(output)
+            # Kèm thêm bản text top hàm tốn thời gian nhất để đọc nhanh
+            with open(f"{output}.txt", "w", encoding="utf-8") as outfile:
+                stats.stream = outfile
+                stats.sort_stats("cumulative").print_stats(40)
+            logger.info(f"cProfile output written to {output}")
+        elif profile == "sample":
+            profiler.stop()
+            output = profile_output or f"./{job_name}.folded"
+            profiler.dump(output)
+            logger.info(f"Sampling profile written to {output}")
+
+        instrumentation.finish(success)
+        instrumentation.log_summary()
+        if metrics_textfile:
+            instrumentation.write_prometheus_textfile(metrics_textfile)
+        _current = previous
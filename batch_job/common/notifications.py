@@ -0,0 +1,428 @@
+import datetime
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set
+
+from loguru import logger
+
+
+@dataclass
+class ObjectNotification:
+    """
+    Thông báo một object vừa được ghi vào bucket
+
+    Args:
+        bucket_name (str): Tên bucket
+        name (str): Tên object
+        size (int): Kích thước object (bytes), 0 nếu không biết
+        created_at (float): Thời điểm object được ghi (epoch seconds), None nếu không biết
+        ack_id (Any): Id dùng để ack / nack, tuỳ theo source
+        delivery_attempt (int): Lần giao thứ mấy nếu source tự đếm (Pub/Sub có dead letter policy), 0 nếu không
+    """
+    bucket_name: str
+    name: str
+    size: int = 0
+    created_at: Optional[float] = None
+    ack_id: Any = None
+    delivery_attempt: int = 0
+
+
+class NotificationSource:
+    """
+    Interface chung cho nguồn notification của streaming mode.
+    Notification được giao ít nhất một lần (at-least-once):
+    notification chưa ack sẽ được giao lại sau khi nack hoặc khi job khởi động lại.
+    """
+
+    def pull(self, max_messages: int, timeout: float) -> List[ObjectNotification]:
+        """
+        Lấy tối đa max_messages notification, đợi tối đa timeout giây nếu chưa có
+        """
+        raise NotImplementedError
+
+    def ack(self, notifications: List[ObjectNotification]) -> None:
+        """
+        Báo đã xử lý xong, notification sẽ không được giao lại
+        """
+        raise NotImplementedError
+
+    def nack(self, notifications: List[ObjectNotification], delay: float = 0.0) -> None:
+        """
+        Báo xử lý lỗi, notification sẽ được giao lại sau ít nhất delay giây
+        """
+        raise NotImplementedError
+
+    def dead_letter(self, notifications: List[ObjectNotification]) -> None:
+        """
+        Bỏ các notification đã lỗi quá nhiều lần sang chỗ riêng để không chặn stream
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+def _atomic_write_json(path: str, value: Any) -> None:
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as outfile:
+        json.dump(value, outfile)
+    os.replace(tmp_path, path)
+
+
+class LocalNotificationQueue(NotificationSource):
+    """
+    Queue notification trên filesystem local, thay cho Pub/Sub khi chạy / test offline.
+    Mỗi notification là một file json trong queue_dir, ack thì xoá file,
+    dead letter thì chuyển file sang queue_dir/dead_letter.
+    LocalStorageBackend(notification_dir=queue_dir) tự publish khi ghi object.
+
+    Args:
+        queue_dir (str): Folder chứa notification
+        poll_interval (float): Khoảng thời gian (giây) giữa 2 lần đọc folder khi queue rỗng
+    """
+
+    def __init__(self, queue_dir: str, poll_interval: float = 0.1):
+        self.queue_dir = os.path.abspath(queue_dir)
+        self.poll_interval = poll_interval
+        # File đã giao nhưng chưa ack / nack
+        self._in_flight: Set[str] = set()
+        # File bị nack, chưa được giao lại trước thời điểm này (time.monotonic)
+        self._not_before: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.queue_dir, exist_ok=True)
+
+    def publish(self, bucket_name: str, name: str, size: int = 0) -> None:
+        # Tên file bắt đầu bằng thời gian để đọc theo thứ tự publish
+        message_id = f"{time.time_ns():020d}-{uuid.uuid4().hex}"
+        _atomic_write_json(os.path.join(self.queue_dir, f"{message_id}.json"), {
+            "bucket": bucket_name,
+            "name": name,
+            "size": size,
+            "created_at": time.time(),
+        })
+
+    def _read_pending(self, max_messages: int) -> List[ObjectNotification]:
+        notifications = []
+        now = time.monotonic()
+        with self._lock:
+            for filename in sorted(os.listdir(self.queue_dir)):
+                if len(notifications) >= max_messages:
+                    break
+                path = os.path.join(self.queue_dir, filename)
+                if not filename.endswith(".json") or path in self._in_flight \
+                        or self._not_before.get(path, 0.0) > now:
+                    continue
+                with open(path, encoding="utf-8") as infile:
+                    message = json.load(infile)
+                self._in_flight.add(path)
+                notifications.append(ObjectNotification(
+                    bucket_name=message["bucket"],
+                    name=message["name"],
+                    size=message.get("size", 0),
+                    created_at=message.get("created_at"),
+                    ack_id=path,
+                ))
+        return notifications
+
+    def pull(self, max_messages: int, timeout: float) -> List[ObjectNotification]:
+        deadline = time.monotonic() + timeout
+        while True:
+            notifications = self._read_pending(max_messages)
+            if notifications or time.monotonic() >= deadline:
+                return notifications
+            time.sleep(min(self.poll_interval, max(0.0, deadline - time.monotonic())))
+
+    def ack(self, notifications: List[ObjectNotification]) -> None:
+        with self._lock:
+            for notification in notifications:
+                self._in_flight.discard(notification.ack_id)
+                self._not_before.pop(notification.ack_id, None)
+                if os.path.exists(notification.ack_id):
+                    os.remove(notification.ack_id)
+
+    def nack(self, notifications: List[ObjectNotification], delay: float = 0.0) -> None:
+        with self._lock:
+            for notification in notifications:
+                self._in_flight.discard(notification.ack_id)
+                self._not_before[notification.ack_id] = time.monotonic() + delay
+
+    def dead_letter(self, notifications: List[ObjectNotification]) -> None:
+        dead_letter_dir = os.path.join(self.queue_dir, "dead_letter")
+        os.makedirs(dead_letter_dir, exist_ok=True)
+        with self._lock:
+            for notification in notifications:
+                self._in_flight.discard(notification.ack_id)
+                self._not_before.pop(notification.ack_id, None)
+                if os.path.exists(notification.ack_id):
+                    os.replace(notification.ack_id,
+                               os.path.join(dead_letter_dir, os.path.basename(notification.ack_id)))
+
+
+def _parse_rfc3339(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+class PubSubNotificationSource(NotificationSource):
+    """
+    Đọc gcs object notification (payload JSON_API_V1) từ một Pub/Sub subscription bằng synchronous pull.
+    Chỉ giữ event OBJECT_FINALIZE, các event khác được ack luôn.
+    Dead letter do dead_letter_policy của subscription thực hiện (xem terraform),
+    max_delivery_attempts nên bằng số lần thử của streaming mode (STREAM_MAX_ATTEMPTS).
+    Lỗi tạm thời của pull (ví dụ ServiceUnavailable) không dừng stream:
+    pull trả về rỗng và chỉ gọi lại Pub/Sub sau retry_backoff giây, gấp đôi sau mỗi lần lỗi liên tiếp.
+
+    Args:
+        subscription (str): projects/<project>/subscriptions/<subscription>
+        retry_backoff (float): Thời gian đợi (giây) sau lần pull lỗi đầu tiên
+        max_retry_backoff (float): Thời gian đợi tối đa giữa 2 lần pull lỗi
+    """
+
+    def __init__(self, subscription: str, retry_backoff: float = 1.0, max_retry_backoff: float = 60.0):
+        self.subscription = subscription
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self._client = None
+        self._pull_failures = 0
+        self._retry_at = 0.0
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google.cloud import pubsub_v1
+
+            self._client = pubsub_v1.SubscriberClient()
+        return self._client
+
+    def pull(self, max_messages: int, timeout: float) -> List[ObjectNotification]:
+        from google.api_core import exceptions
+
+        wait = self._retry_at - time.monotonic()
+        if wait > 0:
+            # Đang backoff sau lỗi: không đợi quá timeout để stream vẫn xử lý được batch đang gom
+            time.sleep(min(wait, timeout))
+            if wait > timeout:
+                return []
+        try:
+            response = self.client.pull(
+                request={"subscription": self.subscription, "max_messages": max_messages},
+                timeout=max(timeout, 1.0),
+            )
+        except exceptions.DeadlineExceeded:
+            return []
+        except (exceptions.ServiceUnavailable, exceptions.InternalServerError, exceptions.Aborted,
+                exceptions.Unknown, exceptions.TooManyRequests, exceptions.ResourceExhausted) as error:
+            self._pull_failures += 1
+            delay = min(self.retry_backoff * 2 ** (self._pull_failures - 1), self.max_retry_backoff)
+            self._retry_at = time.monotonic() + delay
+            logger.warning(f"Pub/Sub pull failed ({error}), retry in {delay:.1f}s")
+            return []
+        self._pull_failures = 0
+
+        notifications, ignored = [], []
+        for received in response.received_messages:
+            attributes = received.message.attributes
+            if attributes.get("eventType") != "OBJECT_FINALIZE":
+                ignored.append(received.ack_id)
+                continue
+            resource = json.loads(received.message.data.decode("utf-8") or "{}")
+            notifications.append(ObjectNotification(
+                bucket_name=attributes["bucketId"],
+                name=attributes["objectId"],
+                size=int(resource.get("size", 0)),
+                created_at=_parse_rfc3339(resource.get("timeCreated")),
+                ack_id=received.ack_id,
+                delivery_attempt=received.delivery_attempt,
+            ))
+        if ignored:
+            self.client.acknowledge(request={"subscription": self.subscription, "ack_ids": ignored})
+        return notifications
+
+    def ack(self, notifications: List[ObjectNotification]) -> None:
+        if notifications:
+            self.client.acknowledge(request={
+                "subscription": self.subscription,
+                "ack_ids": [notification.ack_id for notification in notifications],
+            })
+
+    def nack(self, notifications: List[ObjectNotification], delay: float = 0.0) -> None:
+        # Pub/Sub giao lại khi hết ack deadline (tối đa 600 giây), sau đó retry_policy của subscription
+        if notifications:
+            self.client.modify_ack_deadline(request={
+                "subscription": self.subscription,
+                "ack_ids": [notification.ack_id for notification in notifications],
+                "ack_deadline_seconds": int(min(delay, 600)),
+            })
+
+    def dead_letter(self, notifications: List[ObjectNotification]) -> None:
+        # Nack để Pub/Sub đếm thêm một lần giao, quá max_delivery_attempts thì chuyển sang dead letter topic
+        self.nack(notifications)
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+
+
+class ListingNotificationSource(NotificationSource):
+    """
+    Fallback khi không có notification: định kỳ list bucket theo prefix
+    và trả về các object có thời gian updated từ watermark trở đi.
+
+    State (watermark và tên các object đã xử lý có updated >= watermark) được lưu
+    vào object state_object trong bucket qua backend, nên vẫn còn khi container
+    Cloud Run khởi động lại. Watermark chỉ tăng tới object cũ nhất chưa xử lý xong
+    nên object đang xử lý khi job dừng sẽ được giao lại. Lần đầu chạy (chưa có state)
+    thì bắt đầu từ object mới nhất đang có, không xử lý lại dữ liệu cũ.
+
+    Mỗi lần list vẫn đọc metadata của cả prefix (gcs không lọc được theo updated,
+    tên object theo ngày event nên không dùng start_offset được),
+    bucket lớn nên dùng NOTIFICATION_SOURCE="pubsub".
+
+    Args:
+        backend (StorageBackend): Storage backend dùng để list và lưu state
+        bucket_name (str): Tên bucket
+        prefix (str): Prefix của object cần theo dõi
+        state_object (str): Tên object (ngoài prefix) lưu state, None thì chỉ giữ trong bộ nhớ
+        interval (float): Khoảng thời gian (giây) giữa 2 lần list
+    """
+
+    def __init__(self,
+                 backend,
+                 bucket_name: str,
+                 prefix: str,
+                 state_object: Optional[str] = None,
+                 interval: float = 5.0):
+        if state_object and state_object.startswith(prefix):
+            raise ValueError(f"State object {state_object} must be outside prefix {prefix}")
+        self.backend = backend
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.state_object = state_object
+        self.interval = interval
+        self.watermark: Optional[float] = None
+        # Object đã xử lý có updated >= watermark: name -> updated
+        self._processed: Dict[str, float] = {}
+        self._dead_letter: List[str] = []
+        self._in_flight: Dict[str, ObjectNotification] = {}
+        self._pending: Dict[str, ObjectNotification] = {}
+        # Object bị nack, chưa được giao lại trước thời điểm này (time.monotonic)
+        self._not_before: Dict[str, float] = {}
+        self._last_listed: Optional[float] = None
+        self._load_state()
+
+    def _load_state(self) -> None:
+        if self.state_object and self.backend.exists(self.bucket_name, self.state_object):
+            state = json.loads(self.backend.download_bytes(self.backend.blob(self.bucket_name, self.state_object)))
+            self.watermark = state["watermark"]
+            self._processed = state.get("processed", {})
+            self._dead_letter = state.get("dead_letter", [])
+            return
+        # Chưa có state: coi các object đang có là đã xử lý
+        objects = {blob.name: blob.updated.timestamp() for blob in self.backend.list_blobs(self.bucket_name, self.prefix)}
+        self.watermark = max(objects.values(), default=0.0)
+        self._processed = {name: updated for name, updated in objects.items() if updated == self.watermark}
+        self._last_listed = time.monotonic()
+        self._save_state()
+
+    def _save_state(self) -> None:
+        if self.state_object:
+            self.backend.upload_from_string(
+                self.bucket_name,
+                self.state_object,
+                json.dumps({"watermark": self.watermark, "processed": self._processed, "dead_letter": self._dead_letter}),
+                "application/json",
+            )
+
+    def _list_new_objects(self) -> None:
+        self._last_listed = time.monotonic()
+        for blob in self.backend.list_blobs(self.bucket_name, self.prefix):
+            updated = blob.updated.timestamp()
+            if updated < self.watermark or self._processed.get(blob.name) == updated \
+                    or blob.name in self._in_flight or blob.name in self._pending:
+                continue
+            self._pending[blob.name] = ObjectNotification(
+                bucket_name=self.bucket_name,
+                name=blob.name,
+                size=blob.size or 0,
+                created_at=updated,
+                ack_id=blob.name,
+            )
+
+    def pull(self, max_messages: int, timeout: float) -> List[ObjectNotification]:
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            ready = [name for name in self._pending if self._not_before.get(name, 0.0) <= now]
+            if ready or now >= deadline:
+                break
+            if self._last_listed is None or now >= self._last_listed + self.interval:
+                self._list_new_objects()
+                continue
+            wake_up = min([deadline, self._last_listed + self.interval]
+                          + [self._not_before[name] for name in self._pending if name in self._not_before])
+            time.sleep(max(0.0, wake_up - now))
+
+        notifications = []
+        for name in ready[:max_messages]:
+            notification = self._pending.pop(name)
+            self._not_before.pop(name, None)
+            self._in_flight[name] = notification
+            notifications.append(notification)
+        return notifications
+
+    def _advance_watermark(self) -> None:
+        outstanding = [notification.created_at for notification in [*self._in_flight.values(), *self._pending.values()]]
+        if outstanding:
+            watermark = min(outstanding)
+        else:
+            watermark = max(self._processed.values(), default=self.watermark)
+        self.watermark = max(self.watermark, watermark)
+        self._processed = {name: updated for name, updated in self._processed.items() if updated >= self.watermark}
+        self._save_state()
+
+    def ack(self, notifications: List[ObjectNotification]) -> None:
+        for notification in notifications:
+            self._in_flight.pop(notification.name, None)
+            self._processed[notification.name] = notification.created_at
+        self._advance_watermark()
+
+    def nack(self, notifications: List[ObjectNotification], delay: float = 0.0) -> None:
+        for notification in notifications:
+            self._in_flight.pop(notification.name, None)
+            self._pending[notification.name] = notification
+            self._not_before[notification.name] = time.monotonic() + delay
+
+    def dead_letter(self, notifications: List[ObjectNotification]) -> None:
+        # Không có dead letter topic: ghi tên object vào state rồi bỏ qua
+        self._dead_letter += [notification.name for notification in notifications]
+        self.ack(notifications)
+
+
+def notification_source_from_config(env_config, backend, bucket_name: str, prefix: str) -> NotificationSource:
+    """
+    Tạo nguồn notification từ config (.env hoặc biến môi trường):
+        NOTIFICATION_SOURCE: "pubsub", "local" hoặc "listing" (mặc định)
+        PUBSUB_SUBSCRIPTION: projects/<project>/subscriptions/<subscription> khi dùng "pubsub"
+        LOCAL_NOTIFICATION_DIR: folder của local queue khi dùng "local"
+        LISTING_INTERVAL: số giây giữa 2 lần list bucket khi dùng "listing"
+        LISTING_STATE_OBJECT: object trong bucket lưu watermark khi dùng "listing"
+    """
+    kind = env_config.get("NOTIFICATION_SOURCE", default="listing")
+    if kind == "pubsub":
+        return PubSubNotificationSource(env_config.get("PUBSUB_SUBSCRIPTION"))
+    if kind == "local":
+        return LocalNotificationQueue(env_config.get("LOCAL_NOTIFICATION_DIR", default="") or "./local_notifications")
+    if kind == "listing":
+        return ListingNotificationSource(
+            backend,
+            bucket_name=bucket_name,
+            prefix=prefix,
+            state_object=env_config.get("LISTING_STATE_OBJECT", default="streaming-state/event_info_listing.json"),
+            interval=env_config.get("LISTING_INTERVAL", default=5, cast=float),
+        )
+    raise ValueError(f"Unknown NOTIFICATION_SOURCE: {kind}")
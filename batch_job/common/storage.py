@@ -0,0 +1,280 @@
+import datetime
+import os
+import threading
+from typing import Iterable, List, Optional
+
+
+class LocalBlob:
+    """
+    Object trên filesystem local, có cùng các thuộc tính / hàm
+    của storage.Blob mà các job sử dụng (name, size, updated, download_as_bytes)
+    """
+
+    def __init__(self, path: str, name: str):
+        self.path = path
+        self.name = name
+
+    @property
+    def size(self) -> int:
+        return os.path.getsize(self.path)
+
+    @property
+    def updated(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(os.path.getmtime(self.path), tz=datetime.timezone.utc)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def download_as_bytes(self) -> bytes:
+        with open(self.path, "rb") as infile:
+            return infile.read()
+
+    def __repr__(self) -> str:
+        return f"LocalBlob(name={self.name!r}, path={self.path!r})"
+
+
+class StorageBackend:
+    """
+    Interface chung cho object storage mà 3 job dùng.
+    Mỗi process chỉ nên có một backend (xem get_storage_backend)
+    để tái sử dụng connection.
+    """
+
+    def ensure_bucket(self, bucket_name: str) -> None:
+        raise NotImplementedError
+
+    def list_blobs(self, bucket_name: str, prefix: str) -> Iterable:
+        raise NotImplementedError
+
+    def exists(self, bucket_name: str, name: str) -> bool:
+        raise NotImplementedError
+
+    def download_bytes(self, blob) -> bytes:
+        raise NotImplementedError
+
+    def blob(self, bucket_name: str, name: str):
+        """
+        Trả về blob theo tên (ví dụ object nhận được từ notification)
+        """
+        raise NotImplementedError
+
+    def upload_from_string(self, bucket_name: str, name: str, data: str, content_type: str) -> None:
+        raise NotImplementedError
+
+    def upload_from_filename(self, bucket_name: str, name: str, file_path: str) -> None:
+        raise NotImplementedError
+
+    def arrow_filesystem(self):
+        """
+        Trả về pyarrow FileSystem dùng cho pq.write_to_dataset
+        """
+        raise NotImplementedError
+
+    def dataset_root(self, bucket_name: str, prefix: str) -> str:
+        """
+        Trả về root_path của dataset trên arrow_filesystem()
+        """
+        raise NotImplementedError
+
+
+class GcsStorageBackend(StorageBackend):
+    """
+    Backend google cloud storage dùng chung một storage.Client
+    (connection pool của requests có kích thước `pool_size`)
+    và một pyarrow GcsFileSystem cho cả process.
+
+    Nếu có biến môi trường STORAGE_EMULATOR_HOST (ví dụ fake-gcs-server)
+    thì cả client và GcsFileSystem đều trỏ tới emulator.
+
+    Args:
+        pool_size (int): Số connection HTTP tối đa được giữ lại trong pool
+        timeout (float): Timeout (giây) của mỗi request tới gcs
+    """
+
+    def __init__(self, pool_size: int = 32, timeout: float = 60):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._client = None
+        self._filesystem = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from google.cloud import storage
+                    from requests.adapters import HTTPAdapter
+
+                    client = storage.Client()
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                    # client._http là requests.Session (AuthorizedSession) dùng cho mọi request
+                    client._http.mount("https://", adapter)
+                    client._http.mount("http://", adapter)
+                    self._client = client
+        return self._client
+
+    def ensure_bucket(self, bucket_name: str) -> None:
+        bucket = self.client.bucket(bucket_name)
+        if not bucket.exists(timeout=self.timeout):
+            self.client.create_bucket(bucket_name, timeout=self.timeout)
+
+    def list_blobs(self, bucket_name: str, prefix: str) -> Iterable:
+        return self.client.list_blobs(bucket_name, prefix=prefix, timeout=self.timeout)
+
+    def exists(self, bucket_name: str, name: str) -> bool:
+        return self.client.bucket(bucket_name).blob(name).exists(timeout=self.timeout)
+
+    def download_bytes(self, blob) -> bytes:
+        return blob.download_as_bytes(client=self.client, timeout=self.timeout)
+
+    def blob(self, bucket_name: str, name: str):
+        return self.client.bucket(bucket_name).blob(name)
+
+    def upload_from_string(self, bucket_name: str, name: str, data: str, content_type: str) -> None:
+        blob = self.client.bucket(bucket_name).blob(name)
+        blob.upload_from_string(data, content_type=content_type, timeout=self.timeout)
+
+    def upload_from_filename(self, bucket_name: str, name: str, file_path: str) -> None:
+        blob = self.client.bucket(bucket_name).blob(name)
+        blob.upload_from_filename(file_path, timeout=self.timeout)
+
+    def arrow_filesystem(self):
+        if self._filesystem is None:
+            with self._lock:
+                if self._filesystem is None:
+                    import pyarrow.fs
+
+                    options = {"retry_time_limit": datetime.timedelta(seconds=self.timeout)}
+                    emulator_host = os.environ.get("STORAGE_EMULATOR_HOST")
+                    if emulator_host:
+                        scheme, _, endpoint = emulator_host.rpartition("://")
+                        options.update(anonymous=True, scheme=scheme or "http", endpoint_override=endpoint)
+                    self._filesystem = pyarrow.fs.GcsFileSystem(**options)
+        return self._filesystem
+
+    def dataset_root(self, bucket_name: str, prefix: str) -> str:
+        return f"{bucket_name}/{prefix}"
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Backend lưu object trên filesystem local:
+        gs://bucket_name/name -> root_dir/bucket_name/name
+    Dùng để chạy / benchmark các job khi không có mạng.
+
+    Nếu có notification_dir thì mỗi object ghi xong sẽ được publish vào
+    LocalNotificationQueue(notification_dir), giống bucket notification của gcs.
+
+    Args:
+        root_dir (str): Folder chứa các bucket
+        notification_dir (str): Folder của local notification queue
+    """
+
+    def __init__(self, root_dir: str, notification_dir: Optional[str] = None):
+        self.root_dir = os.path.abspath(root_dir)
+        self.notification_queue = None
+        if notification_dir:
+            from batch_job.common.notifications import LocalNotificationQueue
+
+            self.notification_queue = LocalNotificationQueue(notification_dir)
+
+    def _path(self, bucket_name: str, name: str = "") -> str:
+        return os.path.join(self.root_dir, bucket_name, *name.split("/"))
+
+    def ensure_bucket(self, bucket_name: str) -> None:
+        os.makedirs(self._path(bucket_name), exist_ok=True)
+
+    def list_blobs(self, bucket_name: str, prefix: str) -> List[LocalBlob]:
+        bucket_dir = self._path(bucket_name)
+        # prefix trên gcs là prefix của tên object, không nhất thiết là folder
+        search_dir = self._path(bucket_name, prefix.rsplit("/", 1)[0]) if "/" in prefix else bucket_dir
+        blobs = []
+        for root, dirs, files in os.walk(search_dir):
+            dirs.sort()
+            for filename in sorted(files):
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, bucket_dir).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    blobs.append(LocalBlob(path, name))
+        return blobs
+
+    def exists(self, bucket_name: str, name: str) -> bool:
+        return os.path.isfile(self._path(bucket_name, name))
+
+    def download_bytes(self, blob) -> bytes:
+        return blob.download_as_bytes()
+
+    def blob(self, bucket_name: str, name: str) -> LocalBlob:
+        return LocalBlob(self._path(bucket_name, name), name)
+
+    def _write(self, bucket_name: str, name: str, data: bytes) -> None:
+        path = self._path(bucket_name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Ghi file tạm rồi rename để reader không thấy object ghi dở
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as outfile:
+            outfile.write(data)
+        os.replace(tmp_path, path)
+        if self.notification_queue is not None:
+            self.notification_queue.publish(bucket_name, name, size=len(data))
+
+    def upload_from_string(self, bucket_name: str, name: str, data: str, content_type: str) -> None:
+        self._write(bucket_name, name, data.encode("utf-8"))
+
+    def upload_from_filename(self, bucket_name: str, name: str, file_path: str) -> None:
+        with open(file_path, "rb") as infile:
+            self._write(bucket_name, name, infile.read())
+
+    def arrow_filesystem(self):
+        import pyarrow.fs
+
+        return pyarrow.fs.LocalFileSystem()
+
+    def dataset_root(self, bucket_name: str, prefix: str) -> str:
+        return self._path(bucket_name, prefix)
+
+
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_storage_backend() -> StorageBackend:
+    """
+    Trả về backend dùng chung của process.
+    Mặc định là GcsStorageBackend nếu chưa gọi set_storage_backend.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = GcsStorageBackend()
+    return _backend
+
+
+def set_storage_backend(backend: Optional[StorageBackend]) -> None:
+    global _backend
+    _backend = backend
+
+
+def storage_backend_from_config(env_config) -> StorageBackend:
+    """
+    Tạo backend từ config (.env hoặc biến môi trường):
+        STORAGE_BACKEND: "gcs" (mặc định) hoặc "local"
+        LOCAL_STORAGE_ROOT: folder chứa bucket khi STORAGE_BACKEND = "local"
+        LOCAL_NOTIFICATION_DIR: nếu có, backend local publish notification vào folder này
+        GCS_POOL_SIZE: số connection HTTP tối đa tới gcs
+        GCS_TIMEOUT: timeout (giây) mỗi request tới gcs
+    """
+    kind = env_config.get("STORAGE_BACKEND", default="gcs")
+    if kind == "local":
+        return LocalStorageBackend(
+            env_config.get("LOCAL_STORAGE_ROOT", default="./local_storage"),
+            notification_dir=env_config.get("LOCAL_NOTIFICATION_DIR", default="") or None,
+        )
+    if kind == "gcs":
+        return GcsStorageBackend(
+            pool_size=env_config.get("GCS_POOL_SIZE", default=32, cast=int),
+            timeout=env_config.get("GCS_TIMEOUT", default=60, cast=float),
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND: {kind}")
@@ -1,13 +1,25 @@
+import argparse
 import json
 from decouple import Config, RepositoryEnv
 import datetime
 import psycopg2
 
-from typing import List
+from typing import List, Optional
 
-from google.cloud import storage
 from psycopg2.extras import DictCursor
 
+from batch_job.common.instrumentation import (
+    add_instrumentation_arguments,
+    instrumented_run,
+    stage,
+)
+from batch_job.common.storage import (
+    StorageBackend,
+    get_storage_backend,
+    set_storage_backend,
+    storage_backend_from_config,
+)
+
 
 def datetime_serializer(obj) -> str:
     """
@@ -64,7 +76,10 @@ def get_user_info(dbconfig: dict) -> List[dict]:
     return result
 
 
-def upload_from_string(data: str, bucket_name: str, destination_path: str) -> None:
+def upload_from_string(data: str,
+                       bucket_name: str,
+                       destination_path: str,
+                       backend: Optional[StorageBackend] = None) -> None:
     """
     Upload dữ liệu dạng string của user_info
     chuỗi json theo dòng 
@@ -76,6 +91,7 @@ def upload_from_string(data: str, bucket_name: str, destination_path: str) -> No
         data (str): chuỗi json theo dòng
         bucket_name (str): tên bucket trên gcs
         destination_path (str): tên blob chứa file user_info.json
+        backend (StorageBackend): Storage backend, mặc định là backend dùng chung của process
 
     Ví dụ: 
         data = "
@@ -91,19 +107,17 @@ def upload_from_string(data: str, bucket_name: str, destination_path: str) -> No
         {"user_id" : 1,"birthday": "1990-01-01","sign_in_date": "2023-01-01","sex": "Male","country": "Vietnam"} \n
         {"user_id" : 2,"birthday": "1990-01-01","sign_in_date": "2023-01-02","sex": "Male","country": "Lao"} \n
     """
-    # Get client cloud
-    client = storage.Client()
+    # Get shared storage backend
+    backend = backend or get_storage_backend()
     #TODO: Begin
     # Get bucket or create bucket
-    bucket = client.bucket(bucket_name)
-    if not bucket.exists():
-        bucket = client.create_bucket(bucket_name)
-    # Create blob
-    blob = bucket.blob(destination_path)
-    is_existed = blob.exists()
+    backend.ensure_bucket(bucket_name)
+    is_existed = backend.exists(bucket_name, destination_path)
     if not is_existed:
         # Upload string json to blob and replace into file json    
-        blob.upload_from_string(data,content_type='application/json')
+        with stage("upload") as metrics:
+            backend.upload_from_string(bucket_name, destination_path, data, content_type='application/json')
+            metrics.bytes += len(data.encode("utf-8"))
     #TODO: End
 
 if __name__ == "__main__":
@@ -111,10 +125,21 @@ if __name__ == "__main__":
     Lấy data từ bảng user_info
     và đẩy lên GS
     """
+    parser = argparse.ArgumentParser(
+        prog="Snapshot user_info",
+        description="""
+            Lấy data từ bảng user_info trong Postgres
+            và đẩy lên google cloud storage dưới dạng json theo dòng
+        """,
+    )
+    add_instrumentation_arguments(parser)
+    args = parser.parse_args()
+
     DOTENV_FILE = ".env"
     env_config = Config(RepositoryEnv(DOTENV_FILE))
     BUCKET_NAME = env_config.get("BUCKET_NAME")
     USER_DESTINATION_PATH = env_config.get("USER_DESTINATION_PATH")
+    set_storage_backend(storage_backend_from_config(env_config))
 
     dbconfig = {
         "host": env_config.get("HOST"),
@@ -123,8 +148,18 @@ if __name__ == "__main__":
         "password": env_config.get("PASSWORD"),
         "database": env_config.get("DB"),
     }
-    user_info = get_user_info(dbconfig)
-    #dumps key object to string, and handle data is't object to iso time, prehension, join array to string
-    data = "\n".join([json.dumps(u, default=datetime_serializer) for u in user_info])
-
-    upload_from_string(data=data, bucket_name=BUCKET_NAME, destination_path=USER_DESTINATION_PATH)
+    with instrumented_run("snapshot_user_info",
+                          profile=args.profile,
+                          profile_output=args.profile_output,
+                          metrics_textfile=args.metrics_textfile):
+        with stage("postgres_fetch") as metrics:
+            user_info = get_user_info(dbconfig)
+            metrics.rows += len(user_info)
+
+        with stage("serialize") as metrics:
+            #dumps key object to string, and handle data is't object to iso time, prehension, join array to string
+            data = "\n".join([json.dumps(u, default=datetime_serializer) for u in user_info])
+            metrics.rows += len(user_info)
+            metrics.bytes += len(data)
+
+        upload_from_string(data=data, bucket_name=BUCKET_NAME, destination_path=USER_DESTINATION_PATH)
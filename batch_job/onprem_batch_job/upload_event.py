@@ -2,9 +2,20 @@ from glob import glob
 import argparse
 import os
 import tqdm
+from typing import Optional
 from decouple import Config,RepositoryEnv
 
-from google.cloud import storage
+from batch_job.common.instrumentation import (
+    add_instrumentation_arguments,
+    instrumented_run,
+    stage,
+)
+from batch_job.common.storage import (
+    StorageBackend,
+    get_storage_backend,
+    set_storage_backend,
+    storage_backend_from_config,
+)
 
 
 def encode_destination_path(local_file_path:str,
@@ -39,7 +50,10 @@ def encode_destination_path(local_file_path:str,
     return destination 
 
 
-def upload_file_to_storage(input_path:str,bucket_name:str,destination_prefix:str) ->None :
+def upload_file_to_storage(input_path:str,
+                           bucket_name:str,
+                           destination_prefix:str,
+                           backend:Optional[StorageBackend] = None) ->None :
     """ 
         Upload tất cả file trong folder data có đường dẫn dưới dạng 
         data/year-month-day/file.json
@@ -51,6 +65,7 @@ def upload_file_to_storage(input_path:str,bucket_name:str,destination_prefix:str
             input_path (str): đường dẫn đến folder data
             bucket_name (str): bucket trên google storage
             destination_prefix (str): prefix của google storage
+            backend (StorageBackend): Storage backend, mặc định là backend dùng chung của process
 
         Ví dụ: 
             ├── batch_job
@@ -82,9 +97,8 @@ def upload_file_to_storage(input_path:str,bucket_name:str,destination_prefix:str
                     gs://mmo_adventure_event_processing/bronze-zone/event/2023/08/09/file1.json
                     gs://mmo_adventure_event_processing/bronze-zone/event/2023/08/10/file2.json
     """
-    client = storage.Client()
+    backend = backend or get_storage_backend()
     #TODO: Begin
-    bucket = client.get_bucket(bucket_name)
 
     ### get list dir just 1 level
 
@@ -104,8 +118,11 @@ def upload_file_to_storage(input_path:str,bucket_name:str,destination_prefix:str
     for root, dirs, files in os.walk(input_path):
         for filename in files:
             file_path = os.path.join(root,filename)
-            blob = bucket.blob(encode_destination_path(file_path,destination_prefix))
-            blob.upload_from_filename(file_path)
+            destination_path = encode_destination_path(file_path,destination_prefix)
+            with stage("upload") as metrics:
+                backend.upload_from_filename(bucket_name, destination_path, file_path)
+                metrics.rows += 1
+                metrics.bytes += os.path.getsize(file_path)
 
     #TODO: End
 
@@ -129,6 +146,7 @@ if __name__ == "__main__":
         help="Input path name", 
         required=True
     )
+    add_instrumentation_arguments(parser)
     args = parser.parse_args()
 
     DOTENV_FILE = ".env"
@@ -136,7 +154,12 @@ if __name__ == "__main__":
 
     BUCKET_NAME = env_config.get("BUCKET_NAME")
     DESTINATION_PREFIX = env_config.get("EVENT_BRONZE_ZONE_PREFIX")
+    set_storage_backend(storage_backend_from_config(env_config))
     
-    upload_file_to_storage(args.input_path,
-                        BUCKET_NAME,
-                        DESTINATION_PREFIX)
\ No newline at end of file
+    with instrumented_run("upload_event",
+                          profile=args.profile,
+                          profile_output=args.profile_output,
+                          metrics_textfile=args.metrics_textfile):
+        upload_file_to_storage(args.input_path,
+                            BUCKET_NAME,
+                            DESTINATION_PREFIX)
\ No newline at end of file
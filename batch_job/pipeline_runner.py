@@ -0,0 +1,200 @@
+import argparse
+import os
+import re
+import sys
+import time
+from typing import Dict, List, Optional
+
+from decouple import Config, RepositoryEnv
+from loguru import logger
+
+from batch_job.common.dag import (
+    DagRunner,
+    Step,
+    StepFailed,
+    command_step,
+    critical_path,
+    topological_order,
+)
+from batch_job.common.instrumentation import add_instrumentation_arguments, instrumented_run
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ONPREM_DIR = os.path.join(REPO_ROOT, "batch_job", "onprem_batch_job")
+CLOUD_RUN_DIR = os.path.join(REPO_ROOT, "batch_job", "cloud_run_batch_job")
+DAY_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def list_days(data_path: str) -> List[str]:
+    """
+    Trả về các ngày (folder YYYY-MM-DD) trong folder data
+    """
+    return sorted(name for name in os.listdir(data_path)
+                  if DAY_PATTERN.match(name) and os.path.isdir(os.path.join(data_path, name)))
+
+
+def build_steps(data_path: str,
+                bronze_prefix: str,
+                target: str = "cloud",
+                job_name: str = "cloud-run-batch-job",
+                region: str = "asia-east1") -> List[Step]:
+    """
+    Tạo DAG của `make run` với từng ngày là một nhánh riêng:
+
+        snapshot_user_info
+        upload_event:<day> ------------------------> process_event:<day>
+        build_cloud_image -> update_cloud_run_job --^
+
+    process_event:<day> chỉ xử lý prefix bronze-zone của ngày đó (EVENT_SOURCE_PREFIX)
+    nên chạy được ngay khi ngày đó upload xong.
+
+    Args:
+        data_path (str): Folder data chứa các folder YYYY-MM-DD
+        bronze_prefix (str): Prefix event ở bronze-zone
+        target (str): "cloud" (build image, chạy Cloud Run job) hoặc "local" (chạy main.py local)
+        job_name (str): Tên Cloud Run job
+        region (str): Region của Cloud Run job
+
+    Returns:
+        List[Step]: Các bước của pipeline
+    """
+    python = sys.executable
+    # Các job import package batch_job.common
+    env = {"PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")]))}
+    steps = [
+        command_step("snapshot_user_info", [python, "snapshot_user_info.py"], cwd=ONPREM_DIR, env=env),
+    ]
+
+    process_depends_on: List[str] = []
+    if target == "cloud":
+        make = ["make", "--no-print-directory", "-C", REPO_ROOT]
+        steps += [
+            command_step("build_cloud_image", make + ["build_cloud_image"]),
+            command_step("update_cloud_run_job", make + ["update_cloud_run_job"], depends_on=["build_cloud_image"]),
+        ]
+        process_depends_on = ["update_cloud_run_job"]
+    elif target != "local":
+        raise ValueError(f"Unknown target: {target}")
+
+    for day in list_days(data_path):
+        upload = f"upload_event:{day}"
+        day_prefix = f"{bronze_prefix}/{day.replace('-', '/')}/"
+        steps.append(command_step(
+            upload,
+            [python, "upload_event.py", f"--input-path={os.path.join(data_path, day)}"],
+            cwd=ONPREM_DIR,
+            env=env,
+        ))
+        if target == "cloud":
+            process_command = [
+                "gcloud", "run", "jobs", "execute", job_name,
+                f"--region={region}",
+                "--wait",
+                f"--update-env-vars=EVENT_SOURCE_PREFIX={day_prefix}",
+            ]
+            steps.append(command_step(f"process_event:{day}", process_command,
+                                      depends_on=[upload] + process_depends_on))
+        else:
+            steps.append(command_step(f"process_event:{day}", [python, "main.py"],
+                                      cwd=CLOUD_RUN_DIR,
+                                      env={**env, "EVENT_SOURCE_PREFIX": day_prefix},
+                                      depends_on=[upload]))
+    return steps
+
+
+def format_report(steps: List[Step],
+                  durations: Dict[str, float],
+                  wall_seconds: float,
+                  resumed: Optional[Dict[str, float]] = None) -> str:
+    """
+    Bảng thời gian các bước, longest path tính trên cả DAG
+
+    Args:
+        steps (List[Step]): Tất cả các bước của pipeline
+        durations (Dict[str, float]): Thời gian các bước chạy trong lần này
+        wall_seconds (float): Thời gian chạy của lần này
+        resumed (Dict[str, float]): Thời gian các bước đã xong ở lần chạy trước (bỏ qua trong lần này)
+    """
+    resumed = resumed or {}
+    all_durations = {**resumed, **durations}
+    lines = [f"{'step':<40} {'seconds':>10}"]
+    for step in topological_order(steps):
+        if step.name in durations:
+            lines.append(f"{step.name:<40} {durations[step.name]:>10.1f}")
+        elif step.name in resumed:
+            lines.append(f"{step.name:<40} {resumed[step.name]:>10.1f}  (previous run)")
+    path = critical_path(steps, all_durations)
+    lines += [
+        f"{'sum of steps':<40} {sum(durations.values()):>10.1f}",
+        f"{'longest path':<40} {sum(all_durations.get(name, 0.0) for name in path):>10.1f}  ({' -> '.join(path)})",
+        f"{'wall time':<40} {wall_seconds:>10.1f}",
+    ]
+    return "\n".join(lines)
+
+
+def run(steps: List[Step],
+        state_path: Optional[str],
+        max_workers: int,
+        fresh: bool = False,
+        fingerprint: Optional[dict] = None) -> Dict[str, float]:
+    runner = DagRunner(steps, state_path=state_path, max_workers=max_workers, fingerprint=fingerprint)
+    if fresh:
+        runner.reset()
+    # Các bước đã xong ở lần chạy trước, vẫn cần cho longest path
+    resumed = {name: info.get("duration_seconds", 0.0) for name, info in runner.completed.items()}
+    start = time.perf_counter()
+    durations = runner.run()
+    print(format_report(steps, durations, time.perf_counter() - start, resumed=resumed))
+    return durations
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="Pipeline runner",
+        description="""
+            Chạy snapshot_user_info, upload_event, build image và cloud run job theo DAG,
+            các bước độc lập (và từng ngày event) chạy song song
+        """,
+    )
+    parser.add_argument("--data-path", dest="data_path", default="./data",
+                        help="Folder data chứa các folder YYYY-MM-DD")
+    parser.add_argument("--target", dest="target", choices=["cloud", "local"], default="cloud",
+                        help="cloud: build image và chạy Cloud Run job, local: chạy main.py local")
+    parser.add_argument("--job-name", dest="job_name", default="cloud-run-batch-job")
+    parser.add_argument("--region", dest="region", default="asia-east1")
+    parser.add_argument("--max-workers", dest="max_workers", type=int, default=4,
+                        help="Số bước chạy đồng thời tối đa")
+    parser.add_argument("--state-path", dest="state_path", default="./pipeline_state.json",
+                        help="File lưu các bước đã xong để chạy tiếp sau khi lỗi")
+    parser.add_argument("--fresh", dest="fresh", action="store_true",
+                        help="Bỏ qua state của lần chạy trước, chạy lại tất cả các bước")
+    parser.add_argument("--dry-run", dest="dry_run", action="store_true",
+                        help="Chỉ in các bước và phụ thuộc")
+    add_instrumentation_arguments(parser)
+    args = parser.parse_args()
+
+    env_config = Config(RepositoryEnv(os.path.join(ONPREM_DIR, ".env")))
+    # Tham số quyết định các bước làm gì, state chỉ được dùng lại khi giống lần chạy trước
+    run_config = {
+        "data_path": os.path.abspath(args.data_path),
+        "bronze_prefix": env_config.get("EVENT_BRONZE_ZONE_PREFIX"),
+        "target": args.target,
+        "job_name": args.job_name,
+        "region": args.region,
+    }
+    steps = build_steps(**run_config)
+
+    if args.dry_run:
+        for step in topological_order(steps):
+            print(f"{step.name:<40} <- {', '.join(step.depends_on) or '-'}")
+        sys.exit(0)
+
+    with instrumented_run("pipeline_runner",
+                          profile=args.profile,
+                          profile_output=args.profile_output,
+                          metrics_textfile=args.metrics_textfile):
+        try:
+            run(steps, state_path=args.state_path, max_workers=args.max_workers, fresh=args.fresh,
+                fingerprint=run_config)
+        except StepFailed as error:
+            logger.error(str(error))
+            sys.exit(1)
@@ -0,0 +1,250 @@
+import argparse
+import datetime
+import io
+import json
+import math
+import os
+import random
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+# (event_type, weight) - tỉ lệ gần với log thật: view/play nhiều, purchase ít
+EVENT_TYPE_WEIGHTS = [
+    ("view", 40),
+    ("play", 25),
+    ("log_in", 12),
+    ("log_out", 12),
+    ("purchase", 11),
+]
+COUNTRIES = ["Vietnam", "Thailand", "Lao", "Singapore", "Cambodia", "Malaysia"]
+DEVICES = ["android", "ios", "pc", "web"]
+SEXES = ["Male", "Female"]
+
+MANIFEST_FILE = "manifest.json"
+
+
+def _event_attribute(rng: random.Random, event_type: str):
+    if event_type == "purchase":
+        return {
+            "revenue": round(rng.uniform(0.99, 199.99), 2),
+            "transaction_id": uuid.UUID(int=rng.getrandbits(128)).hex[:20],
+        }
+    if event_type == "play":
+        return {"play_time": rng.randint(1, 7200)}
+    if event_type == "view":
+        return {
+            "creative_id": rng.randint(1, 500),
+            "view_time": rng.randint(1, 120),
+            "is_click": rng.random() < 0.08,
+        }
+    return []
+
+
+def generate_event(rng: random.Random, timestamp: datetime.datetime, num_users: int) -> dict:
+    """
+    Sinh một event giả có cùng format với file event trong folder data
+
+    Ví dụ:
+        {"event_id": "...", "event_type": "play", "timestamp": "2023-08-12 10:00:00",
+         "user_id": 12, "location": "Vietnam", "device": "ios", "ip_address": "10.0.0.1",
+         "event_attribute": {"play_time": 100}}
+    """
+    event_type = rng.choices(
+        [event_type for event_type, _ in EVENT_TYPE_WEIGHTS],
+        weights=[weight for _, weight in EVENT_TYPE_WEIGHTS],
+    )[0]
+    return {
+        "event_id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "event_type": event_type,
+        "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+        "user_id": rng.randint(1, num_users),
+        "location": rng.choice(COUNTRIES),
+        "device": rng.choice(DEVICES),
+        "ip_address": ".".join(str(rng.randint(1, 254)) for _ in range(4)),
+        "event_attribute": _event_attribute(rng, event_type),
+    }
+
+
+def _write_event_file(task: Tuple[str, str, int, int, int]) -> str:
+    file_path, day, num_events, num_users, seed = task
+    rng = random.Random(seed)
+    day_start = datetime.datetime.strptime(day, "%Y-%m-%d")
+    seconds = sorted(rng.randrange(86400) for _ in range(num_events))
+
+    buffer = io.StringIO()
+    for second in seconds:
+        event = generate_event(rng, day_start + datetime.timedelta(seconds=second), num_users)
+        buffer.write(json.dumps(event) + "\n")
+    with open(file_path, "w", encoding="utf-8") as outfile:
+        outfile.write(buffer.getvalue())
+    return file_path
+
+
+def generate_event_files(output_dir: str,
+                         num_events: int,
+                         num_days: int = 3,
+                         start_date: str = "2023-08-12",
+                         events_per_file: int = 10000,
+                         num_users: int = 100,
+                         seed: int = 42,
+                         workers: Optional[int] = None) -> List[str]:
+    """
+    Sinh các file event theo cấu trúc
+        output_dir/data/YYYY-MM-DD/<uuid>.json
+    giống folder data, chia đều num_events cho num_days ngày.
+    Thông số sinh data được ghi vào output_dir/manifest.json
+
+    Args:
+        output_dir (str): Folder output, chứa folder data và manifest.json
+        num_events (int): Tổng số event
+        num_days (int): Số ngày
+        start_date (str): Ngày bắt đầu dạng YYYY-MM-DD
+        events_per_file (int): Số event tối đa của mỗi file
+        num_users (int): user_id được random trong [1, num_users]
+        seed (int): Seed để sinh lại được cùng một bộ data
+        workers (int): Số process dùng để sinh file
+
+    Returns:
+        List[str]: Danh sách đường dẫn file đã sinh
+    """
+    rng = random.Random(seed)
+    start = datetime.datetime.strptime(start_date, "%Y-%m-%d")
+    tasks = []
+    for day_index in range(num_days):
+        day = (start + datetime.timedelta(days=day_index)).strftime("%Y-%m-%d")
+        day_dir = os.path.join(output_dir, "data", day)
+        os.makedirs(day_dir, exist_ok=True)
+
+        day_events = num_events // num_days + (1 if day_index < num_events % num_days else 0)
+        num_files = max(1, math.ceil(day_events / events_per_file))
+        for file_index in range(num_files):
+            file_events = day_events // num_files + (1 if file_index < day_events % num_files else 0)
+            file_name = f"{uuid.UUID(int=rng.getrandbits(128))}.json"
+            tasks.append((os.path.join(day_dir, file_name), day, file_events, num_users, rng.getrandbits(32)))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        files = list(executor.map(_write_event_file, tasks))
+
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w", encoding="utf-8") as outfile:
+        json.dump({
+            "num_events": num_events,
+            "num_days": num_days,
+            "start_date": start_date,
+            "events_per_file": events_per_file,
+            "num_users": num_users,
+            "seed": seed,
+            "num_files": len(files),
+        }, outfile, indent=2)
+    return files
+
+
+def generate_user_info_rows(num_users: int, seed: int = 42) -> Iterator[tuple]:
+    """
+    Sinh các dòng (user_id, birthday, sign_in_date, sex, country)
+    có cùng schema với bảng user_info
+    """
+    rng = random.Random(seed)
+    for user_id in range(1, num_users + 1):
+        birthday = datetime.date(1990, 1, 1) + datetime.timedelta(days=rng.randrange(15 * 365))
+        sign_in_date = datetime.date(2021, 1, 1) + datetime.timedelta(days=rng.randrange(3 * 365))
+        yield (user_id, birthday, sign_in_date, rng.choice(SEXES), rng.choice(COUNTRIES))
+
+
+def load_user_info(dbconfig: dict, num_users: int, seed: int = 42, chunk_size: int = 100000) -> None:
+    """
+    Tạo lại bảng user_info trong database `dbconfig["database"]`
+    và load num_users dòng bằng COPY.
+
+    Nên dùng database riêng cho benchmark (ví dụ adventure_mmo_game_benchmark)
+    để không đụng vào data của integration test.
+    """
+    import psycopg2
+
+    admin_config = {**dbconfig, "database": "postgres"}
+    admin_connection = psycopg2.connect(**admin_config)
+    admin_connection.autocommit = True
+    try:
+        with admin_connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (dbconfig["database"],))
+            if cursor.fetchone() is None:
+                cursor.execute(f'CREATE DATABASE "{dbconfig["database"]}"')
+    finally:
+        admin_connection.close()
+
+    connection = psycopg2.connect(**dbconfig)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS user_info")
+            cursor.execute("""
+                CREATE TABLE user_info (
+                    user_id integer NOT NULL,
+                    birthday date,
+                    sign_in_date date,
+                    sex text,
+                    country text
+                )
+            """)
+            buffer = io.StringIO()
+            for index, row in enumerate(generate_user_info_rows(num_users, seed), start=1):
+                buffer.write("\t".join(str(value) for value in row) + "\n")
+                if index % chunk_size == 0:
+                    buffer.seek(0)
+                    cursor.copy_expert("COPY user_info FROM STDIN", buffer)
+                    buffer = io.StringIO()
+            buffer.seek(0)
+            cursor.copy_expert("COPY user_info FROM STDIN", buffer)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="Sinh data benchmark",
+        description="""
+            Sinh file event dạng output-dir/data/YYYY-MM-DD/*.json
+            và (tuỳ chọn) bảng user_info trong Postgres local
+        """,
+    )
+    parser.add_argument("--output-dir", dest="output_dir", required=True, help="Output folder, events go to <output-dir>/data")
+    parser.add_argument("--events", dest="events", type=int, default=100000, help="Total number of events")
+    parser.add_argument("--days", dest="days", type=int, default=3, help="Number of days")
+    parser.add_argument("--start-date", dest="start_date", default="2023-08-12", help="First day, YYYY-MM-DD")
+    parser.add_argument("--events-per-file", dest="events_per_file", type=int, default=10000)
+    parser.add_argument("--users", dest="users", type=int, default=None,
+                        help="Number of users (default: events / 100, at least 100)")
+    parser.add_argument("--seed", dest="seed", type=int, default=42)
+    parser.add_argument("--workers", dest="workers", type=int, default=None)
+    parser.add_argument("--load-postgres", dest="load_postgres", action="store_true",
+                        help="Also load user_info rows into the benchmark database")
+    parser.add_argument("--env-file", dest="env_file", default="./benchmarks/.env",
+                        help="Env file with the benchmark Postgres config")
+    args = parser.parse_args()
+
+    num_users = args.users or max(100, args.events // 100)
+    files = generate_event_files(
+        output_dir=args.output_dir,
+        num_events=args.events,
+        num_days=args.days,
+        start_date=args.start_date,
+        events_per_file=args.events_per_file,
+        num_users=num_users,
+        seed=args.seed,
+        workers=args.workers,
+    )
+    print(f"Generated {args.events} events in {len(files)} files under {args.output_dir}")
+
+    if args.load_postgres:
+        from decouple import Config, RepositoryEnv
+
+        env_config = Config(RepositoryEnv(args.env_file))
+        dbconfig = {
+            "host": env_config.get("HOST"),
+            "port": env_config.get("DB_PORT"),
+            "user": env_config.get("DB_USER"),
+            "password": env_config.get("PASSWORD"),
+            "database": env_config.get("DB"),
+        }
+        load_user_info(dbconfig, num_users, seed=args.seed)
+        print(f"Loaded {num_users} user_info rows into {dbconfig['database']}")
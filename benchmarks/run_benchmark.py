@@ -0,0 +1,309 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Callable, Dict, List
+
+from loguru import logger
+
+from batch_job.common.instrumentation import instrumented_run, peak_rss_bytes
+from batch_job.common.storage import LocalBlob, LocalStorageBackend
+from benchmarks.generate_data import MANIFEST_FILE
+
+STAGES = ["encode_destination_path", "transform_event_attribute", "etl", "etl_pipelined", "snapshot"]
+BUCKET_NAME = "mmo_adventure_event_processing"
+DESTINATION_PREFIX = "gold-zone/event_info"
+USER_DESTINATION_PATH = "bronze-zone/user_info/user_info.json"
+
+
+class StageSkipped(Exception):
+    pass
+
+
+def list_event_files(data_dir: str) -> List[str]:
+    files = []
+    for root, dirs, filenames in os.walk(os.path.join(data_dir, "data")):
+        dirs.sort()
+        for filename in sorted(filenames):
+            files.append(os.path.join(root, filename))
+    return files
+
+
+def bench_encode_destination_path(data_dir: str, work_dir: str, options: dict) -> dict:
+    from batch_job.onprem_batch_job.upload_event import encode_destination_path
+
+    files = list_event_files(data_dir)
+    calls = max(len(files), options["min_calls"])
+    for index in range(calls):
+        encode_destination_path(files[index % len(files)], "bronze-zone/event_info")
+    return {"rows": calls, "bytes": 0}
+
+
+def bench_transform_event_attribute(data_dir: str, work_dir: str, options: dict) -> dict:
+    from batch_job.cloud_run_batch_job.main import _transform_event_attribute
+
+    # Chỉ đo hàm transform: load sẵn event_attribute (giới hạn sample_events dòng)
+    attributes = []
+    for file_path in list_event_files(data_dir):
+        with open(file_path, encoding="utf-8") as infile:
+            for line in infile:
+                if line.strip():
+                    attributes.append(json.loads(line)["event_attribute"])
+                if len(attributes) >= options["sample_events"]:
+                    break
+        if len(attributes) >= options["sample_events"]:
+            break
+
+    start = time.perf_counter()
+    for attribute in attributes:
+        _transform_event_attribute(attribute)
+    return {"rows": len(attributes), "bytes": 0, "seconds": time.perf_counter() - start}
+
+
+def bench_etl(data_dir: str, work_dir: str, options: dict) -> dict:
+    from batch_job.cloud_run_batch_job.main import event_json_schema, extract_transform_load_event_to_parquet
+
+    backend = LocalStorageBackend(work_dir)
+    total_bytes = 0
+    for file_path in list_event_files(data_dir):
+        blob = LocalBlob(file_path, os.path.relpath(file_path, data_dir))
+        extract_transform_load_event_to_parquet(
+            blob=blob,
+            bucket_name=BUCKET_NAME,
+            destination_prefix=DESTINATION_PREFIX,
+            schema=event_json_schema(),
+            backend=backend,
+        )
+        total_bytes += os.path.getsize(file_path)
+    with open(os.path.join(data_dir, MANIFEST_FILE), encoding="utf-8") as infile:
+        rows = json.load(infile)["num_events"]
+    return {"rows": rows, "bytes": total_bytes}
+
+
+def bench_etl_pipelined(data_dir: str, work_dir: str, options: dict) -> dict:
+    from batch_job.cloud_run_batch_job.main import event_json_schema, run_pipelined_etl
+
+    files = list_event_files(data_dir)
+    blobs = [LocalBlob(file_path, os.path.relpath(file_path, data_dir)) for file_path in files]
+    run_pipelined_etl(
+        blobs,
+        bucket_name=BUCKET_NAME,
+        destination_prefix=DESTINATION_PREFIX,
+        schema=event_json_schema(),
+        backend=LocalStorageBackend(work_dir),
+    )
+    with open(os.path.join(data_dir, MANIFEST_FILE), encoding="utf-8") as infile:
+        rows = json.load(infile)["num_events"]
+    return {"rows": rows, "bytes": sum(os.path.getsize(file_path) for file_path in files)}
+
+
+def bench_snapshot(data_dir: str, work_dir: str, options: dict) -> dict:
+    import psycopg2
+    from decouple import Config, RepositoryEnv
+    from batch_job.onprem_batch_job.snapshot_user_info import datetime_serializer, get_user_info, upload_from_string
+
+    env_config = Config(RepositoryEnv(options["env_file"]))
+    dbconfig = {
+        "host": env_config.get("HOST"),
+        "port": env_config.get("DB_PORT"),
+        "user": env_config.get("DB_USER"),
+        "password": env_config.get("PASSWORD"),
+        "database": env_config.get("DB"),
+    }
+    try:
+        psycopg2.connect(**dbconfig).close()
+    except psycopg2.OperationalError as e:
+        raise StageSkipped(f"Postgres is not reachable: {str(e).strip().splitlines()[0]}")
+
+    user_info = get_user_info(dbconfig)
+    data = "\n".join([json.dumps(u, default=datetime_serializer) for u in user_info])
+    upload_from_string(data, BUCKET_NAME, USER_DESTINATION_PATH, backend=LocalStorageBackend(work_dir))
+    return {"rows": len(user_info), "bytes": len(data)}
+
+
+BENCHMARKS: Dict[str, Callable[[str, str, dict], dict]] = {
+    "encode_destination_path": bench_encode_destination_path,
+    "transform_event_attribute": bench_transform_event_attribute,
+    "etl": bench_etl,
+    "etl_pipelined": bench_etl_pipelined,
+    "snapshot": bench_snapshot,
+}
+
+
+def run_stage(stage_name: str, data_dir: str, work_dir: str, options: dict) -> dict:
+    """
+    Chạy một stage benchmark và trả về số liệu:
+    thời gian, số dòng, throughput, peak RSS (process chạy stage + worker lớn nhất của nó)
+    và thời gian các stage con (instrumentation)
+    """
+    stage_dir = os.path.join(work_dir, stage_name)
+    os.makedirs(stage_dir, exist_ok=True)
+    try:
+        with instrumented_run(f"benchmark_{stage_name}") as instrumentation:
+            result = BENCHMARKS[stage_name](data_dir, stage_dir, options)
+    except StageSkipped as e:
+        return {"stage": stage_name, "skipped": str(e)}
+
+    seconds = result.get("seconds", instrumentation.duration_seconds)
+    return {
+        "stage": stage_name,
+        "seconds": seconds,
+        "rows": result["rows"],
+        "bytes": result["bytes"],
+        "rows_per_second": result["rows"] / seconds if seconds else 0.0,
+        "mb_per_second": result["bytes"] / seconds / 1e6 if seconds else 0.0,
+        # etl_pipelined transform trong worker process, tính cả RSS của worker
+        "peak_rss_bytes": peak_rss_bytes(include_children=True),
+        "breakdown": {
+            name: round(metrics.duration_seconds, 6) for name, metrics in instrumentation.stages.items()
+        },
+    }
+
+
+def run_stage_isolated(stage_name: str, data_dir: str, work_dir: str, options: dict) -> dict:
+    # Mỗi stage chạy trong process riêng để peak RSS là của riêng stage đó
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        return executor.submit(run_stage, stage_name, data_dir, work_dir, options).result()
+
+
+def dataset_key(data_dir: str) -> str:
+    """
+    Key của baseline, gồm tất cả thông số sinh data trong manifest
+    để 2 bộ data khác nhau (số ngày, số event mỗi file, seed, ...) không dùng chung baseline
+
+    Ví dụ: "events_per_file=10000,num_days=3,num_events=100000,num_files=10,num_users=100,seed=42,start_date=2023-08-12"
+    """
+    with open(os.path.join(data_dir, MANIFEST_FILE), encoding="utf-8") as infile:
+        manifest = json.load(infile)
+    return ",".join(f"{key}={value}" for key, value in sorted(manifest.items()))
+
+
+def compare_to_baseline(results: List[dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """
+    So sánh kết quả với baseline của cùng bộ data.
+    Regression khi throughput thấp hơn hoặc peak RSS cao hơn baseline quá `tolerance`.
+
+    Returns:
+        List[str]: Mô tả các regression, rỗng nếu không có
+    """
+    regressions = []
+    for result in results:
+        expected = baseline.get(result["stage"])
+        if expected is None or "skipped" in result:
+            continue
+        min_throughput = expected["rows_per_second"] * (1 - tolerance)
+        if result["rows_per_second"] < min_throughput:
+            regressions.append(
+                f"{result['stage']}: throughput {result['rows_per_second']:.0f} rows/s "
+                f"< baseline {expected['rows_per_second']:.0f} rows/s"
+            )
+        max_rss = expected["peak_rss_bytes"] * (1 + tolerance)
+        if result["peak_rss_bytes"] > max_rss:
+            regressions.append(
+                f"{result['stage']}: peak RSS {result['peak_rss_bytes'] / 2**20:.0f} MiB "
+                f"> baseline {expected['peak_rss_bytes'] / 2**20:.0f} MiB"
+            )
+    return regressions
+
+
+def format_report(results: List[dict]) -> str:
+    lines = [f"{'stage':<30}{'seconds':>10}{'rows':>14}{'rows/s':>14}{'MB/s':>10}{'peak RSS MiB':>14}"]
+    for result in results:
+        if "skipped" in result:
+            lines.append(f"{result['stage']:<30}skipped ({result['skipped']})")
+            continue
+        lines.append(
+            f"{result['stage']:<30}{result['seconds']:>10.3f}{result['rows']:>14}"
+            f"{result['rows_per_second']:>14.0f}{result['mb_per_second']:>10.2f}"
+            f"{result['peak_rss_bytes'] / 2**20:>14.1f}"
+        )
+        for name, seconds in result["breakdown"].items():
+            lines.append(f"  - {name:<26}{seconds:>10.3f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="Benchmark pipeline",
+        description="""
+            Chạy các stage của pipeline trên data sinh bởi benchmarks/generate_data.py
+            với filesystem local, báo cáo throughput / memory
+            và so sánh với baseline
+        """,
+    )
+    parser.add_argument("--data-dir", dest="data_dir", required=True,
+                        help="Folder created by generate_data.py")
+    parser.add_argument("--stages", dest="stages", default=",".join(STAGES),
+                        help=f"Comma separated stages, from: {','.join(STAGES)}")
+    parser.add_argument("--work-dir", dest="work_dir", default=None,
+                        help="Folder for benchmark output (default: temporary folder)")
+    parser.add_argument("--baseline", dest="baseline", default="./benchmarks/baselines.json")
+    parser.add_argument("--update-baseline", dest="update_baseline", action="store_true",
+                        help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", dest="tolerance", type=float, default=0.2,
+                        help="Allowed relative slowdown / memory growth before flagging a regression")
+    parser.add_argument("--output", dest="output", default=None, help="Write results as json")
+    parser.add_argument("--sample-events", dest="sample_events", type=int, default=1000000,
+                        help="Max events loaded for the transform_event_attribute stage")
+    parser.add_argument("--min-calls", dest="min_calls", type=int, default=100000,
+                        help="Min calls for the encode_destination_path stage")
+    parser.add_argument("--env-file", dest="env_file", default="./benchmarks/.env",
+                        help="Env file with the benchmark Postgres config")
+    args = parser.parse_args()
+
+    stages = [stage_name.strip() for stage_name in args.stages.split(",") if stage_name.strip()]
+    unknown = set(stages) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    options = {
+        "sample_events": args.sample_events,
+        "min_calls": args.min_calls,
+        "env_file": os.path.abspath(args.env_file),
+    }
+    data_dir = os.path.abspath(args.data_dir)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="benchmark_")
+    try:
+        results = [run_stage_isolated(stage_name, data_dir, os.path.abspath(work_dir), options)
+                   for stage_name in stages]
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(format_report(results))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as outfile:
+            json.dump(results, outfile, indent=2)
+
+    key = dataset_key(data_dir)
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as infile:
+            baselines = json.load(infile)
+
+    if args.update_baseline:
+        baselines.setdefault(key, {}).update({
+            result["stage"]: {
+                "rows_per_second": result["rows_per_second"],
+                "peak_rss_bytes": result["peak_rss_bytes"],
+            }
+            for result in results if "skipped" not in result
+        })
+        with open(args.baseline, "w", encoding="utf-8") as outfile:
+            json.dump(baselines, outfile, indent=2, sort_keys=True)
+        logger.info(f"Baseline for {key} written to {args.baseline}")
+        sys.exit(0)
+
+    if key not in baselines:
+        logger.warning(f"No baseline for {key} in {args.baseline}, run with --update-baseline to create one")
+        sys.exit(0)
+
+    regressions = compare_to_baseline(results, baselines[key], args.tolerance)
+    for regression in regressions:
+        logger.error(f"Regression {regression}")
+    sys.exit(1 if regressions else 0)
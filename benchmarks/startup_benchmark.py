@@ -0,0 +1,201 @@
+import argparse
+import collections
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from benchmarks.generate_data import generate_event_files
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JOB_DIR = os.path.join(REPO_ROOT, "batch_job", "cloud_run_batch_job")
+JOB_MODULE = "batch_job.cloud_run_batch_job.main"
+BUCKET_NAME = "mmo_adventure_event_processing"
+SOURCE_PREFIX = "bronze-zone/event_info"
+BASELINE_KEY = "startup"
+
+
+def _job_env(**extra: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_ROOT, env.get("PYTHONPATH")]))
+    env.update(extra)
+    return env
+
+
+def parse_importtime(output: str, top: int = 10) -> dict:
+    """
+    Tổng hợp output của `python -X importtime`:
+        import time: self [us] | cumulative | imported package
+
+    Args:
+        output (str): stderr của process chạy với -X importtime
+        top (int): Số package top-level tốn thời gian nhất cần giữ lại
+
+    Returns:
+        dict: total_seconds (tổng self time) và top_packages [(package, seconds)]
+            theo thời gian self cộng dồn của cả package
+    """
+    total_us = 0
+    packages = collections.Counter()
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # Bỏ qua dòng header
+            continue
+        self_us = int(fields[0])
+        package = fields[2].strip().split(".")[0]
+        total_us += self_us
+        packages[package] += self_us
+    return {
+        "total_seconds": total_us / 1e6,
+        "top_packages": [(package, us / 1e6) for package, us in packages.most_common(top)],
+    }
+
+
+def measure_import(runs: int = 5) -> dict:
+    """
+    Đo thời gian import module của job (cold start trước khi xử lý blob nào)
+    trong `runs` process mới, lấy median.
+    """
+    results = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {JOB_MODULE}"],
+            cwd=REPO_ROOT, env=_job_env(), capture_output=True, text=True, check=True,
+        )
+        results.append(parse_importtime(completed.stderr))
+    median = statistics.median(result["total_seconds"] for result in results)
+    return {
+        "import_seconds": median,
+        "top_packages": min(results, key=lambda result: abs(result["total_seconds"] - median))["top_packages"],
+    }
+
+
+def parse_job_summary(output: str) -> Optional[dict]:
+    """
+    Tìm dòng job_summary (JSON) mà instrumented_run log ra khi job kết thúc
+    """
+    for line in reversed(output.splitlines()):
+        if not line.startswith("{"):
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("event") == "job_summary":
+            return record
+    return None
+
+
+def measure_first_blob(work_dir: str, runs: int = 3, engine: str = "pipelined") -> dict:
+    """
+    Chạy main.py (giống Cloud Run) trên một blob nhỏ với STORAGE_BACKEND=local,
+    lấy median của wall time và time_to_first_blob (tính từ lúc process bắt đầu).
+    """
+    data_dir = os.path.join(work_dir, "input")
+    files = generate_event_files(data_dir, num_events=100, num_days=1, events_per_file=100, workers=1)
+    storage_root = os.path.join(work_dir, "storage")
+    source_path = os.path.join(storage_root, BUCKET_NAME, *SOURCE_PREFIX.split("/"), "startup.json")
+    os.makedirs(os.path.dirname(source_path), exist_ok=True)
+    os.replace(files[0], source_path)
+
+    env = _job_env(STORAGE_BACKEND="local", LOCAL_STORAGE_ROOT=storage_root, ENGINE=engine)
+    wall_times, first_blob_times = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "main.py"],
+            cwd=JOB_DIR, env=env, capture_output=True, text=True, check=True,
+        )
+        wall_times.append(time.perf_counter() - start)
+        summary = parse_job_summary(completed.stderr)
+        stages = {stage["name"]: stage for stage in (summary or {}).get("stages", [])}
+        if "time_to_first_blob" not in stages:
+            raise RuntimeError(f"time_to_first_blob not reported by the job:\n{completed.stderr}")
+        first_blob_times.append(stages["time_to_first_blob"]["duration_seconds"])
+    return {
+        "wall_seconds": statistics.median(wall_times),
+        "time_to_first_blob_seconds": statistics.median(first_blob_times),
+    }
+
+
+def compare_to_baseline(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Regression khi một số đo (càng thấp càng tốt) cao hơn baseline quá `tolerance`
+    """
+    regressions = []
+    for metric, expected in baseline.items():
+        actual = result.get(metric)
+        if actual is not None and actual > expected * (1 + tolerance):
+            regressions.append(f"startup: {metric} {actual:.3f}s > baseline {expected:.3f}s")
+    return regressions
+
+
+def format_report(result: dict) -> str:
+    lines = [
+        f"import time (median): {result['import_seconds'] * 1000:.1f} ms",
+        f"time to first blob:   {result['time_to_first_blob_seconds'] * 1000:.1f} ms",
+        f"job wall time:        {result['wall_seconds'] * 1000:.1f} ms",
+        "top imports:",
+    ]
+    for package, seconds in result["top_packages"]:
+        lines.append(f"  {package:<30} {seconds * 1000:8.1f} ms")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="Startup benchmark",
+        description="""
+            Đo cold start của cloud run job: thời gian import (python -X importtime)
+            và thời gian từ lúc process bắt đầu tới khi blob đầu tiên được ghi
+        """,
+    )
+    parser.add_argument("--runs", dest="runs", type=int, default=5)
+    parser.add_argument("--engine", dest="engine", choices=["pipelined", "sequential"], default="pipelined")
+    parser.add_argument("--output", dest="output", default=None, help="Write the result as JSON")
+    parser.add_argument("--baseline", dest="baseline", default="./benchmarks/baselines.json")
+    parser.add_argument("--update-baseline", dest="update_baseline", action="store_true",
+                        help="Store this result as the new baseline")
+    parser.add_argument("--tolerance", dest="tolerance", type=float, default=0.2,
+                        help="Allowed slowdown before reporting a regression")
+    args = parser.parse_args()
+
+    result = measure_import(runs=args.runs)
+    with tempfile.TemporaryDirectory(prefix="startup_benchmark_") as work_dir:
+        result.update(measure_first_blob(work_dir, runs=max(1, args.runs // 2), engine=args.engine))
+
+    print(format_report(result))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as outfile:
+            json.dump(result, outfile, indent=2)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as infile:
+            baselines = json.load(infile)
+
+    measured = {metric: result[metric] for metric in ("import_seconds", "time_to_first_blob_seconds", "wall_seconds")}
+    if args.update_baseline:
+        baselines[BASELINE_KEY] = measured
+        with open(args.baseline, "w", encoding="utf-8") as outfile:
+            json.dump(baselines, outfile, indent=2, sort_keys=True)
+        logger.info(f"Startup baseline written to {args.baseline}")
+        sys.exit(0)
+
+    if BASELINE_KEY not in baselines:
+        logger.warning(f"No startup baseline in {args.baseline}, run with --update-baseline to create one")
+        sys.exit(0)
+
+    regressions = compare_to_baseline(measured, baselines[BASELINE_KEY], args.tolerance)
+    for regression in regressions:
+        logger.error(f"Regression {regression}")
+    sys.exit(1 if regressions else 0)
@@ -49,4 +49,119 @@ resource "google_cloud_run_v2_job" "cloud_run_batch_job" {
             launch_stage,
         ]
     }
-}
\ No newline at end of file
+}
+
+# Object notification của bronze-zone cho streaming mode (MODE="stream", NOTIFICATION_SOURCE="pubsub")
+data "google_storage_project_service_account" "gcs_account" {
+}
+
+resource "google_pubsub_topic" "bronze_event_notification" {
+    name = "bronze-event-notification"
+}
+
+resource "google_pubsub_topic_iam_binding" "bronze_event_notification_publisher" {
+    topic   = google_pubsub_topic.bronze_event_notification.id
+    role    = "roles/pubsub.publisher"
+    members = ["serviceAccount:${data.google_storage_project_service_account.gcs_account.email_address}"]
+}
+
+resource "google_storage_notification" "bronze_event_notification" {
+    bucket             = google_storage_bucket.mmo_adventure_event_processing.name
+    payload_format     = "JSON_API_V1"
+    topic              = google_pubsub_topic.bronze_event_notification.id
+    event_types        = ["OBJECT_FINALIZE"]
+    object_name_prefix = "bronze-zone/event_info/"
+    depends_on         = [google_pubsub_topic_iam_binding.bronze_event_notification_publisher]
+}
+
+# Pub/Sub service agent chuyển message lỗi quá max_delivery_attempts lần sang dead letter topic
+data "google_project" "project" {
+}
+
+locals {
+    pubsub_service_agent = "serviceAccount:service-${data.google_project.project.number}@gcp-sa-pubsub.iam.gserviceaccount.com"
+}
+
+resource "google_pubsub_topic" "bronze_event_dead_letter" {
+    name = "bronze-event-dead-letter"
+}
+
+resource "google_pubsub_subscription" "bronze_event_dead_letter" {
+    name                       = "bronze-event-dead-letter"
+    topic                      = google_pubsub_topic.bronze_event_dead_letter.id
+    message_retention_duration = "604800s"
+}
+
+resource "google_pubsub_topic_iam_binding" "bronze_event_dead_letter_publisher" {
+    topic   = google_pubsub_topic.bronze_event_dead_letter.id
+    role    = "roles/pubsub.publisher"
+    members = [local.pubsub_service_agent]
+}
+
+resource "google_pubsub_subscription" "cloud_run_stream" {
+    name                 = "cloud-run-stream"
+    topic                = google_pubsub_topic.bronze_event_notification.id
+    ack_deadline_seconds = 60
+
+    # Bằng STREAM_MAX_ATTEMPTS của job
+    dead_letter_policy {
+        dead_letter_topic     = google_pubsub_topic.bronze_event_dead_letter.id
+        max_delivery_attempts = 5
+    }
+
+    retry_policy {
+        minimum_backoff = "10s"
+        maximum_backoff = "600s"
+    }
+}
+
+resource "google_pubsub_subscription_iam_binding" "cloud_run_stream_subscriber" {
+    subscription = google_pubsub_subscription.cloud_run_stream.name
+    role         = "roles/pubsub.subscriber"
+    members      = [
+        "serviceAccount:${google_service_account.batch_job.email}",
+        # Service agent cần ack message đã chuyển sang dead letter topic
+        local.pubsub_service_agent,
+    ]
+}
+
+# Streaming mode chạy như một Cloud Run job nên bị dừng khi hết task timeout:
+# Cloud Scheduler tạo execution mới mỗi giờ, timeout dài hơn chu kỳ một chút để 2 execution chạy chồng lên nhau
+# (cùng đọc một subscription nên không xử lý trùng), execution bị lỗi cũng được thay thế ở lần chạy sau
+resource "google_cloud_run_v2_job_iam_member" "cloud_run_stream_executor" {
+    name     = google_cloud_run_v2_job.cloud_run_batch_job.name
+    location = var.region
+    role     = "roles/run.jobsExecutorWithOverrides"
+    member   = "serviceAccount:${google_service_account.batch_job.email}"
+}
+
+resource "google_cloud_scheduler_job" "cloud_run_stream" {
+    name             = "cloud-run-stream"
+    region           = var.region
+    schedule         = var.stream_schedule
+    attempt_deadline = "60s"
+
+    http_target {
+        http_method = "POST"
+        uri         = "https://run.googleapis.com/v2/projects/${var.project}/locations/${var.region}/jobs/${google_cloud_run_v2_job.cloud_run_batch_job.name}:run"
+        headers     = {"Content-Type" = "application/json"}
+        body        = base64encode(jsonencode({
+            overrides = {
+                timeout = var.stream_task_timeout
+                containerOverrides = [{
+                    env = [
+                        {name = "MODE", value = "stream"},
+                        {name = "NOTIFICATION_SOURCE", value = "pubsub"},
+                        {name = "PUBSUB_SUBSCRIPTION", value = google_pubsub_subscription.cloud_run_stream.id},
+                    ]
+                }]
+            }
+        }))
+
+        oauth_token {
+            service_account_email = google_service_account.batch_job.email
+        }
+    }
+
+    depends_on = [google_cloud_run_v2_job_iam_member.cloud_run_stream_executor]
+}
@@ -11,4 +11,14 @@ variable "region" {
 variable "cloud_run_image" { 
     description = "Cloud Run Image"
     default = "cloud-run-batch-job"
-}
\ No newline at end of file
+}
+
+variable "stream_task_timeout" {
+    description = "Task timeout of each streaming mode execution, a bit longer than the stream_schedule period so executions overlap"
+    default = "3900s"
+}
+
+variable "stream_schedule" {
+    description = "Cron schedule that starts a new streaming mode execution"
+    default = "0 * * * *"
+}
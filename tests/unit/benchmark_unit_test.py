@@ -0,0 +1,84 @@
+import json
+import os
+import re
+from benchmarks.generate_data import generate_event_files, MANIFEST_FILE
+from benchmarks.run_benchmark import compare_to_baseline, list_event_files, run_stage
+from batch_job.onprem_batch_job.upload_event import encode_destination_path
+
+
+def test_generate_event_files(tmp_path):
+    files = generate_event_files(str(tmp_path), num_events=1000, num_days=2, events_per_file=300, workers=1)
+
+    assert len(files) == 4
+    events = []
+    for file_path in files:
+        # Upload job phải encode được path của file sinh ra
+        destination = encode_destination_path(file_path, "bronze-zone/event_info")
+        assert re.match(r"bronze-zone/event_info/\d{4}/\d{2}/\d{2}/[A-Za-z0-9\-]+\.json", destination)
+        with open(file_path, encoding="utf-8") as infile:
+            events.extend(json.loads(line) for line in infile if line.strip())
+
+    assert len(events) == 1000
+    assert {event["event_type"] for event in events} == {"purchase", "play", "view", "log_in", "log_out"}
+    for event in events:
+        if event["event_type"] in ("log_in", "log_out"):
+            assert event["event_attribute"] == []
+    manifest = json.loads((tmp_path / MANIFEST_FILE).read_text())
+    assert manifest["num_events"] == 1000
+
+
+def test_run_etl_stage_on_local_filesystem(tmp_path):
+    data_dir = tmp_path / "data_set"
+    generate_event_files(str(data_dir), num_events=500, num_days=2, workers=1)
+
+    result = run_stage("etl", str(data_dir), str(tmp_path / "work"), {})
+
+    assert result["rows"] == 500
+    assert result["rows_per_second"] > 0
+    assert "write_to_dataset" in result["breakdown"]
+    partitions = os.listdir(tmp_path / "work" / "etl" / "mmo_adventure_event_processing" / "gold-zone" / "event_info" / "year=2023" / "month=8")
+    assert sorted(partitions) == ["day=12", "day=13"]
+    assert len(list_event_files(str(data_dir))) == 2
+
+
+def test_compare_to_baseline():
+    baseline = {
+        "etl": {"rows_per_second": 1000.0, "peak_rss_bytes": 100 * 2**20},
+        "snapshot": {"rows_per_second": 1000.0, "peak_rss_bytes": 100 * 2**20},
+    }
+    results = [
+        {"stage": "etl", "rows_per_second": 900.0, "peak_rss_bytes": 150 * 2**20},
+        {"stage": "snapshot", "skipped": "Postgres is not reachable"},
+        {"stage": "encode_destination_path", "rows_per_second": 1.0, "peak_rss_bytes": 1},
+    ]
+
+    regressions = compare_to_baseline(results, baseline, tolerance=0.2)
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith("etl: peak RSS")
+
+
+def test_parse_importtime():
+    from benchmarks.startup_benchmark import parse_importtime
+
+    output = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       100 |        100 |   pyarrow.lib",
+        "import time:       300 |        400 | pyarrow",
+        "import time:        50 |         50 | loguru",
+    ])
+    result = parse_importtime(output, top=1)
+
+    assert result["total_seconds"] == 450 / 1e6
+    assert result["top_packages"] == [("pyarrow", 400 / 1e6)]
+
+
+def test_dataset_key_uses_whole_manifest(tmp_path):
+    from benchmarks.run_benchmark import dataset_key
+
+    first, second = tmp_path / "first", tmp_path / "second"
+    generate_event_files(str(first), num_events=100, num_days=2, events_per_file=50, workers=1)
+    generate_event_files(str(second), num_events=100, num_days=2, events_per_file=50, seed=7, workers=1)
+
+    assert dataset_key(str(first)) != dataset_key(str(second))
+    assert "seed=42" in dataset_key(str(first))
@@ -81,3 +81,44 @@ def test_transform_event_attribute(test_name, event_attribute, expected):
     len(result) == len(expected)
     for item in expected:
         assert item in result
+
+
+def test_transform_event_data_partition_columns(compare_schema):
+    import datetime
+    import json
+    from batch_job.cloud_run_batch_job.main import event_json_schema, transform_event_data
+
+    events = [
+        {"event_id": "1", "event_type": "play", "timestamp": "2023-08-12 23:59:59", "user_id": 1,
+         "location": "Vietnam", "device": "ios", "ip_address": "10.0.0.1", "event_attribute": {"play_time": 10}},
+        {"event_id": "2", "event_type": "log_in", "timestamp": "2024-01-01 00:00:00", "user_id": 2,
+         "location": "Japan", "device": "android", "ip_address": "10.0.0.2", "event_attribute": []},
+    ]
+    data = "\n".join(json.dumps(event) for event in events).encode("utf-8")
+
+    table = transform_event_data(data, event_json_schema())
+
+    assert table.schema.equals(compare_schema)
+    assert table.column("timestamp").to_pylist() == [
+        datetime.datetime(2023, 8, 12, 23, 59, 59),
+        datetime.datetime(2024, 1, 1, 0, 0, 0),
+    ]
+    assert table.column("year").to_pylist() == [2023, 2024]
+    assert table.column("month").to_pylist() == [8, 1]
+    assert table.column("day").to_pylist() == [12, 1]
+
+
+def test_import_main_does_not_load_heavy_dependencies():
+    import os
+    import subprocess
+    import sys
+
+    # Cold start: pyarrow / pandas / google.cloud chỉ được import khi job thật sự xử lý blob
+    code = (
+        "import sys, batch_job.cloud_run_batch_job.main; "
+        "print(sorted(m for m in ('pandas', 'pyarrow', 'google.cloud.storage') if m in sys.modules))"
+    )
+    repo_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    output = subprocess.run([sys.executable, "-c", code], cwd=repo_root,
+                            capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
@@ -0,0 +1,100 @@
+import asyncio
+import pstats
+import threading
+import time
+import pytest
+import pyarrow.dataset as ds
+from batch_job.common.instrumentation import instrumented_run
+from batch_job.common.storage import LocalBlob, LocalStorageBackend
+from batch_job.cloud_run_batch_job.pipeline import run_pipeline
+from batch_job.cloud_run_batch_job.main import event_json_schema, run_pipelined_etl
+from benchmarks.generate_data import generate_event_files
+from benchmarks.run_benchmark import list_event_files
+
+
+class FakeBlob:
+    def __init__(self, name):
+        self.name = name
+
+
+def test_run_pipeline_processes_every_blob_with_bounded_memory():
+    lock = threading.Lock()
+    in_flight = {"current": 0, "max": 0}
+    written = []
+
+    def download(blob):
+        with lock:
+            in_flight["current"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["current"])
+        return blob.name.encode("utf-8")
+
+    def transform(data):
+        time.sleep(0.001)
+        return data.decode("utf-8").upper()
+
+    def write(table):
+        # Writer chậm -> các stage trước phải dừng lại chờ
+        time.sleep(0.002)
+        with lock:
+            in_flight["current"] -= 1
+        written.append(table)
+
+    blobs = [FakeBlob(f"blob-{index}") for index in range(50)]
+    processed = asyncio.run(run_pipeline(
+        blobs, download, transform, write,
+        download_concurrency=2, transform_workers=2, write_concurrency=1, queue_size=2, executor="thread",
+    ))
+
+    assert processed == 50
+    assert sorted(written) == sorted(f"BLOB-{index}" for index in range(50))
+    # download_concurrency + transform_workers + write_concurrency + 2 queues
+    assert in_flight["max"] <= 2 + 2 + 1 + 2 * 2
+
+
+def test_run_pipeline_raises_stage_error():
+    def transform(data):
+        if data == b"bad":
+            raise ValueError("cannot parse")
+        return data
+
+    blobs = [FakeBlob(name) for name in ["good", "bad", "good"]]
+    with pytest.raises(ValueError, match="cannot parse"):
+        asyncio.run(run_pipeline(
+            blobs, lambda blob: blob.name.encode("utf-8"), transform, lambda table: None,
+            transform_workers=1, executor="thread",
+        ))
+
+
+def test_run_pipelined_etl_with_process_workers(tmp_path):
+    generate_event_files(str(tmp_path / "data_set"), num_events=900, num_days=3, events_per_file=100, workers=1)
+    files = list_event_files(str(tmp_path / "data_set"))
+    blobs = [LocalBlob(file_path, file_path) for file_path in files]
+    backend = LocalStorageBackend(str(tmp_path / "storage"))
+
+    processed = run_pipelined_etl(
+        blobs, "bucket", "gold-zone/event_info", event_json_schema(), backend=backend,
+        transform_workers=2, executor="process",
+    )
+
+    assert processed == len(files) == 9
+    dataset = ds.dataset(backend.dataset_root("bucket", "gold-zone/event_info"), format="parquet", partitioning="hive")
+    assert dataset.count_rows() == 900
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_cprofile_covers_pipeline_workers(tmp_path, executor):
+    generate_event_files(str(tmp_path / "data_set"), num_events=200, num_days=2, events_per_file=100, workers=1)
+    files = list_event_files(str(tmp_path / "data_set"))
+    blobs = [LocalBlob(file_path, file_path) for file_path in files]
+    backend = LocalStorageBackend(str(tmp_path / "storage"))
+    output = str(tmp_path / "job.prof")
+
+    with instrumented_run("cloud_run_batch_job", profile="cprofile", profile_output=output):
+        run_pipelined_etl(
+            blobs, "bucket", "gold-zone/event_info", event_json_schema(), backend=backend,
+            transform_workers=2, executor=executor,
+        )
+
+    profiled = {function for _, _, function in pstats.Stats(output).stats}
+    # Download / write chạy trên thread io, transform trên thread hoặc worker process
+    assert {"download_bytes", "transform_event_data", "write_to_dataset"} <= profiled
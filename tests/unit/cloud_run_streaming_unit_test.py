@@ -0,0 +1,224 @@
+import json
+import time
+import pyarrow.dataset as ds
+from types import SimpleNamespace
+from google.api_core import exceptions
+from batch_job.common.notifications import (
+    ListingNotificationSource,
+    LocalNotificationQueue,
+    ObjectNotification,
+    PubSubNotificationSource,
+)
+from batch_job.common.storage import LocalStorageBackend
+from batch_job.cloud_run_batch_job.main import event_json_schema, run_streaming_etl
+from batch_job.cloud_run_batch_job.streaming import MicroBatcher, run_micro_batches
+
+BUCKET_NAME = "mmo_adventure_event_processing"
+SOURCE_PREFIX = "bronze-zone/event_info"
+DESTINATION_PREFIX = "gold-zone/event_info"
+
+
+def event_lines(day: str, count: int) -> str:
+    return "\n".join(json.dumps({
+        "event_id": f"{day}-{index}", "event_type": "play", "timestamp": f"{day} 10:00:00", "user_id": index,
+        "location": "Vietnam", "device": "ios", "ip_address": "10.0.0.1", "event_attribute": {"play_time": 1},
+    }) for index in range(count))
+
+
+def test_micro_batcher_by_count_size_and_time():
+    now = {"value": 0.0}
+    batcher = MicroBatcher(max_objects=3, max_bytes=100, max_wait_seconds=5, clock=lambda: now["value"])
+
+    batcher.add(ObjectNotification(BUCKET_NAME, "a", size=10))
+    batcher.add(ObjectNotification(BUCKET_NAME, "b", size=10))
+    assert not batcher.ready()
+    batcher.add(ObjectNotification(BUCKET_NAME, "c", size=10))
+    assert batcher.ready()
+    assert [n.name for n in batcher.drain()] == ["a", "b", "c"]
+
+    batcher.add(ObjectNotification(BUCKET_NAME, "big", size=100))
+    assert batcher.ready()
+    batcher.drain()
+
+    batcher.add(ObjectNotification(BUCKET_NAME, "late", size=1))
+    now["value"] = 4.0
+    assert not batcher.ready() and batcher.time_left() == 1.0
+    now["value"] = 5.0
+    assert batcher.ready()
+
+
+def test_run_streaming_etl_appends_to_gold_partitions(tmp_path):
+    queue_dir = str(tmp_path / "notifications")
+    backend = LocalStorageBackend(str(tmp_path / "storage"), notification_dir=queue_dir)
+    backend.upload_from_string(BUCKET_NAME, f"{SOURCE_PREFIX}/2023/08/12/a.json",
+                               event_lines("2023-08-12", 3), "application/json")
+    backend.upload_from_string(BUCKET_NAME, f"{SOURCE_PREFIX}/2023/08/13/b.json",
+                               event_lines("2023-08-13", 2), "application/json")
+    # Object ngoài prefix chỉ được ack, không xử lý
+    backend.upload_from_string(BUCKET_NAME, "bronze-zone/user_info/user_info.json", "{}", "application/json")
+    batches = []
+
+    processed = run_streaming_etl(
+        LocalNotificationQueue(queue_dir, poll_interval=0.01),
+        bucket_name=BUCKET_NAME,
+        source_prefix=SOURCE_PREFIX,
+        destination_prefix=DESTINATION_PREFIX,
+        schema=event_json_schema(),
+        backend=backend,
+        max_batch_objects=2,
+        max_wait_seconds=0.1,
+        idle_timeout=0.3,
+        on_batch=batches.append,
+    )
+
+    assert processed == 2
+    assert [len(batch) for batch in batches] == [2]
+    assert not list((tmp_path / "notifications").iterdir())
+    dataset = ds.dataset(backend.dataset_root(BUCKET_NAME, DESTINATION_PREFIX), partitioning="hive")
+    assert dataset.count_rows() == 5
+    assert dataset.count_rows(filter=ds.field("day") == 13) == 2
+
+
+def test_failed_micro_batch_is_redelivered(tmp_path):
+    queue = LocalNotificationQueue(str(tmp_path), poll_interval=0.01)
+    queue.publish(BUCKET_NAME, "a")
+    queue.publish(BUCKET_NAME, "b")
+    attempts = []
+
+    class Table:
+        num_rows = 1
+
+    def write(tables):
+        attempts.append(len(tables))
+        if len(attempts) == 1:
+            raise RuntimeError("gcs unavailable")
+
+    processed = run_micro_batches(
+        queue,
+        accept=lambda notification: True,
+        download=lambda notification: notification.name.encode("utf-8"),
+        transform=lambda data: Table(),
+        write=write,
+        max_batch_objects=2,
+        max_wait_seconds=0.05,
+        idle_timeout=0.2,
+        retry_backoff=0.01,
+    )
+
+    assert attempts == [2, 2]
+    assert processed == 2
+    assert not list(tmp_path.iterdir())
+
+
+def test_bad_object_does_not_block_good_objects(tmp_path):
+    queue = LocalNotificationQueue(str(tmp_path), poll_interval=0.01)
+    for name in ["good1", "bad", "good2"]:
+        queue.publish(BUCKET_NAME, name)
+    downloads = []
+    written = []
+
+    class Table:
+        num_rows = 1
+
+    def download(notification):
+        downloads.append(notification.name)
+        if notification.name == "bad":
+            raise ValueError("corrupted object")
+        return notification.name.encode("utf-8")
+
+    def transform(data):
+        table = Table()
+        table.name = data.decode("utf-8")
+        return table
+
+    processed = run_micro_batches(
+        queue,
+        accept=lambda notification: True,
+        download=download,
+        transform=transform,
+        write=lambda tables: written.extend(table.name for table in tables),
+        max_batch_objects=3,
+        max_wait_seconds=0.05,
+        idle_timeout=0.3,
+        max_attempts=3,
+        retry_backoff=0.05,
+    )
+
+    assert processed == 2
+    assert sorted(written) == ["good1", "good2"]
+    # Chỉ object lỗi được thử lại, có backoff, và dừng sau max_attempts lần
+    assert downloads.count("bad") == 3
+    assert downloads.count("good1") == downloads.count("good2") == 1
+    assert [path.name for path in tmp_path.iterdir()] == ["dead_letter"]
+    assert len(list((tmp_path / "dead_letter").iterdir())) == 1
+
+
+def test_listing_source_keeps_watermark_in_bucket(tmp_path):
+    backend = LocalStorageBackend(str(tmp_path / "storage"))
+    state_object = "streaming-state/event_info_listing.json"
+    backend.upload_from_string(BUCKET_NAME, f"{SOURCE_PREFIX}/old.json", "old", "application/json")
+
+    # Lần đầu chạy bắt đầu từ hiện tại, không xử lý lại object cũ
+    source = ListingNotificationSource(backend, BUCKET_NAME, SOURCE_PREFIX, state_object=state_object, interval=0.01)
+    assert source.pull(max_messages=10, timeout=0.05) == []
+    time.sleep(0.01)
+    backend.upload_from_string(BUCKET_NAME, f"{SOURCE_PREFIX}/a.json", "a", "application/json")
+    time.sleep(0.01)
+    backend.upload_from_string(BUCKET_NAME, f"{SOURCE_PREFIX}/b.json", "b", "application/json")
+    first = source.pull(max_messages=10, timeout=0.1)
+    assert sorted(n.name for n in first) == [f"{SOURCE_PREFIX}/a.json", f"{SOURCE_PREFIX}/b.json"]
+    # Object đang xử lý không được giao lại
+    assert source.pull(max_messages=10, timeout=0.05) == []
+    # b xong, a chưa xong khi job dừng: watermark không vượt qua a
+    source.ack([n for n in first if n.name.endswith("b.json")])
+
+    time.sleep(0.01)
+    backend.upload_from_string(BUCKET_NAME, f"{SOURCE_PREFIX}/c.json", "c", "application/json")
+    restarted = ListingNotificationSource(backend, BUCKET_NAME, SOURCE_PREFIX, state_object=state_object, interval=0.01)
+    again = restarted.pull(max_messages=10, timeout=0.1)
+    assert sorted(n.name for n in again) == [f"{SOURCE_PREFIX}/a.json", f"{SOURCE_PREFIX}/c.json"]
+    restarted.ack(again)
+
+    state = json.loads(backend.download_bytes(backend.blob(BUCKET_NAME, state_object)))
+    assert state["watermark"] == max(n.created_at for n in again)
+    assert list(state["processed"]) == [f"{SOURCE_PREFIX}/c.json"]
+
+
+def test_pubsub_pull_backs_off_on_transient_errors():
+    message = SimpleNamespace(
+        ack_id="ack-1",
+        delivery_attempt=1,
+        message=SimpleNamespace(
+            attributes={"eventType": "OBJECT_FINALIZE", "bucketId": BUCKET_NAME, "objectId": "a.json"},
+            data=b'{"size": "10"}',
+        ),
+    )
+    responses = [exceptions.ServiceUnavailable("unavailable"), exceptions.InternalServerError("internal"),
+                 SimpleNamespace(received_messages=[message])]
+    calls = []
+
+    class Client:
+        def pull(self, request, timeout):
+            calls.append(time.monotonic())
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+    source = PubSubNotificationSource("projects/p/subscriptions/s", retry_backoff=0.05)
+    source._client = Client()
+
+    assert source.pull(max_messages=10, timeout=0.01) == []
+    # Đang backoff: không gọi Pub/Sub
+    assert source.pull(max_messages=10, timeout=0.01) == []
+    assert len(calls) == 1
+    notifications = []
+    for _ in range(50):
+        notifications = source.pull(max_messages=10, timeout=0.05)
+        if notifications:
+            break
+
+    assert [n.name for n in notifications] == ["a.json"]
+    assert len(calls) == 3
+    # Lần lỗi thứ 2 đợi gấp đôi
+    assert calls[2] - calls[1] >= 0.1
@@ -0,0 +1,161 @@
+import json
+import threading
+import time
+import pytest
+from batch_job.common.dag import DagRunner, Step, StepFailed, critical_path, topological_order
+from batch_job.pipeline_runner import build_steps, format_report, run
+
+
+def test_independent_steps_run_concurrently():
+    lock = threading.Lock()
+    order = []
+
+    def sleep_step(name):
+        def run():
+            time.sleep(0.2)
+            with lock:
+                order.append(name)
+        return run
+
+    steps = [
+        Step("snapshot", sleep_step("snapshot")),
+        Step("upload", sleep_step("upload")),
+        Step("process", sleep_step("process"), depends_on=["upload"]),
+    ]
+    start = time.perf_counter()
+    durations = DagRunner(steps, max_workers=4).run()
+    elapsed = time.perf_counter() - start
+
+    assert set(durations) == {"snapshot", "upload", "process"}
+    assert order[-1] == "process"
+    # Longest path là 2 bước, không phải tổng 3 bước
+    assert elapsed < 0.55
+
+
+def test_failed_run_resumes_from_failed_step(tmp_path):
+    state_path = str(tmp_path / "state.json")
+    calls = []
+    fail = {"process": True}
+
+    def step(name):
+        def run():
+            calls.append(name)
+            if fail.get(name):
+                raise RuntimeError(f"{name} failed")
+        return run
+
+    steps = [
+        Step("upload", step("upload")),
+        Step("process", step("process"), depends_on=["upload"]),
+        Step("report", step("report"), depends_on=["process"]),
+    ]
+    with pytest.raises(StepFailed):
+        DagRunner(steps, state_path=state_path).run()
+    with open(state_path, encoding="utf-8") as infile:
+        assert list(json.load(infile)["completed"]) == ["upload"]
+
+    fail["process"] = False
+    durations = DagRunner(steps, state_path=state_path).run()
+
+    assert set(durations) == {"process", "report"}
+    assert calls == ["upload", "process", "process", "report"]
+    assert not (tmp_path / "state.json").exists()
+
+
+def test_resumed_run_reports_longest_path_over_whole_dag(tmp_path, capsys):
+    state_path = str(tmp_path / "state.json")
+    fail = {"process": True}
+
+    def step(name):
+        def run_step():
+            time.sleep(0.01)
+            if fail.get(name):
+                raise RuntimeError(f"{name} failed")
+        return run_step
+
+    steps = [
+        Step("upload", step("upload")),
+        Step("process", step("process"), depends_on=["upload"]),
+    ]
+    with pytest.raises(StepFailed):
+        run(steps, state_path=state_path, max_workers=2)
+
+    fail["process"] = False
+    durations = run(steps, state_path=state_path, max_workers=2)
+
+    assert set(durations) == {"process"}
+    report = capsys.readouterr().out
+    assert "upload -> process" in report
+    assert "(previous run)" in report
+    assert not (tmp_path / "state.json").exists()
+    assert "upload -> process" in format_report(steps, {"process": 2.0}, 2.0, resumed={"upload": 1.0})
+
+
+def test_state_is_not_reused_for_different_run(tmp_path):
+    state_path = str(tmp_path / "state.json")
+    calls = []
+
+    def step(name):
+        def run():
+            calls.append(name)
+            if name == "process":
+                raise RuntimeError("process failed")
+        return run
+
+    steps = [
+        Step("upload", step("upload")),
+        Step("process", step("process"), depends_on=["upload"]),
+    ]
+    local_run = {"target": "local", "data_path": "/data/a"}
+    with pytest.raises(StepFailed):
+        DagRunner(steps, state_path=state_path, fingerprint=local_run).run()
+
+    assert DagRunner(steps, state_path=state_path, fingerprint=local_run).completed.keys() == {"upload"}
+    assert DagRunner(steps, state_path=state_path, fingerprint={**local_run, "target": "cloud"}).completed == {}
+    assert not (tmp_path / "state.json").exists()
+
+    with pytest.raises(StepFailed):
+        DagRunner(steps, state_path=state_path, fingerprint=local_run).run()
+    assert DagRunner(steps, state_path=state_path, fingerprint={**local_run, "data_path": "/data/b"}).completed == {}
+    with pytest.raises(StepFailed):
+        DagRunner(steps, state_path=state_path, fingerprint=local_run).run()
+    assert DagRunner(steps[:1], state_path=state_path, fingerprint=local_run).completed == {}
+
+
+def test_invalid_dag():
+    with pytest.raises(ValueError, match="Cycle"):
+        topological_order([Step("a", print, depends_on=["b"]), Step("b", print, depends_on=["a"])])
+    with pytest.raises(ValueError, match="unknown"):
+        topological_order([Step("a", print, depends_on=["missing"])])
+
+
+def test_critical_path():
+    steps = [
+        Step("snapshot", print),
+        Step("build", print),
+        Step("upload", print),
+        Step("process", print, depends_on=["upload", "build"]),
+    ]
+    durations = {"snapshot": 5, "build": 4, "upload": 2, "process": 3}
+
+    assert critical_path(steps, durations) == ["build", "process"]
+
+
+def test_build_steps_per_day(tmp_path):
+    for day in ["2023-08-12", "2023-08-13"]:
+        (tmp_path / day).mkdir()
+    (tmp_path / "README.md").write_text("")
+
+    steps = {step.name: step for step in build_steps(str(tmp_path), "bronze-zone/event_info", target="cloud")}
+
+    assert set(steps) == {
+        "snapshot_user_info", "build_cloud_image", "update_cloud_run_job",
+        "upload_event:2023-08-12", "upload_event:2023-08-13",
+        "process_event:2023-08-12", "process_event:2023-08-13",
+    }
+    assert steps["snapshot_user_info"].depends_on == []
+    assert steps["process_event:2023-08-13"].depends_on == ["upload_event:2023-08-13", "update_cloud_run_job"]
+
+    local_steps = {step.name: step for step in build_steps(str(tmp_path), "bronze-zone/event_info", target="local")}
+    assert local_steps["process_event:2023-08-12"].depends_on == ["upload_event:2023-08-12"]
+    assert "build_cloud_image" not in local_steps
@@ -0,0 +1,110 @@
+import json
+from batch_job.common.instrumentation import (
+    Instrumentation,
+    get_instrumentation,
+    instrumented_run,
+    record_stage,
+    stage,
+)
+
+
+def test_stage_accumulates_metrics():
+    instrumentation = Instrumentation("test_job")
+    for _ in range(3):
+        with instrumentation.stage("download") as metrics:
+            metrics.rows += 2
+            metrics.bytes += 10
+    instrumentation.record("parse_json", 0.5, rows=4)
+
+    download = instrumentation.stages["download"]
+    assert download.calls == 3
+    assert download.rows == 6
+    assert download.bytes == 30
+    assert download.duration_seconds >= 0
+    assert download.peak_rss_bytes > 0
+    assert instrumentation.stages["parse_json"].duration_seconds == 0.5
+
+
+def test_prometheus_textfile(tmp_path):
+    instrumentation = Instrumentation("test_job")
+    with instrumentation.stage("upload") as metrics:
+        metrics.bytes += 42
+    instrumentation.finish(success=True)
+
+    path = tmp_path / "test_job.prom"
+    instrumentation.write_prometheus_textfile(str(path))
+    content = path.read_text()
+
+    assert "# TYPE batch_job_stage_bytes gauge" in content
+    assert 'batch_job_stage_bytes{job="test_job",stage="upload"} 42' in content
+    assert 'batch_job_success{job="test_job"} 1' in content
+
+
+def test_instrumented_run_with_profile(tmp_path):
+    profile_output = tmp_path / "job.prof"
+    metrics_textfile = tmp_path / "job.prom"
+    with instrumented_run("test_job",
+                          profile="cprofile",
+                          profile_output=str(profile_output),
+                          metrics_textfile=str(metrics_textfile)) as instrumentation:
+        # Module level helpers record into the running job
+        assert get_instrumentation() is instrumentation
+        with stage("transform") as metrics:
+            metrics.rows += sum(1 for _ in range(1000))
+        record_stage("write", 0.1, rows=1000)
+
+    summary = instrumentation.summary()
+    json.dumps(summary)
+    assert summary["success"] is True
+    assert [s["name"] for s in summary["stages"]] == ["transform", "write"]
+    assert profile_output.exists()
+    assert metrics_textfile.exists()
+    assert get_instrumentation() is not instrumentation
+
+
+def test_job_summary_is_a_json_line(capsys):
+    from benchmarks.startup_benchmark import parse_job_summary
+
+    with instrumented_run("test_job"):
+        with stage("transform") as metrics:
+            metrics.rows += 1
+
+    err = capsys.readouterr().err
+    records = [json.loads(line) for line in err.splitlines() if line.startswith("{")]
+    # Stage log ở mức TRACE, mặc định chỉ có job summary
+    assert [record["event"] for record in records] == ["job_summary"]
+    assert records[0]["severity"] == "INFO"
+    assert records[0]["stages"][0]["rows"] == 1
+    assert parse_job_summary(err) == records[0]
+
+
+def _allocate(size):
+    return len(bytearray(size))
+
+
+def test_peak_rss_includes_children():
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+    from batch_job.common.instrumentation import peak_rss_bytes
+
+    size = 256 * 2**20
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        assert executor.submit(_allocate, size).result() == size
+
+    assert peak_rss_bytes(include_children=True) >= peak_rss_bytes() + size
+
+
+def test_seconds_since_process_start_includes_time_before_import():
+    import os
+    import subprocess
+    import sys
+
+    repo_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    code = (
+        "import time; time.sleep(0.3); "
+        "from batch_job.common.instrumentation import seconds_since_process_start; "
+        "print(seconds_since_process_start())"
+    )
+    output = subprocess.run([sys.executable, "-c", code], cwd=repo_root,
+                            capture_output=True, text=True, check=True).stdout
+    assert 0.3 <= float(output) < 5
@@ -0,0 +1,84 @@
+import pyarrow.dataset as ds
+from decouple import Config, RepositoryEnv
+from batch_job.common.storage import (
+    GcsStorageBackend,
+    LocalStorageBackend,
+    storage_backend_from_config,
+)
+from batch_job.onprem_batch_job.snapshot_user_info import upload_from_string
+from batch_job.onprem_batch_job.upload_event import upload_file_to_storage
+from batch_job.cloud_run_batch_job.main import (
+    event_json_schema,
+    extract_transform_load_event_to_parquet,
+    list_file_in_bucket,
+)
+
+BUCKET_NAME = "mmo_adventure_event_processing"
+EVENTS = [
+    '{"event_id": "1", "event_type": "purchase", "timestamp": "2023-08-12 10:00:00", "user_id": 1, '
+    '"location": "Vietnam", "device": "ios", "ip_address": "10.0.0.1", '
+    '"event_attribute": {"revenue": 12.5, "transaction_id": "abc"}}',
+    '{"event_id": "2", "event_type": "log_in", "timestamp": "2023-08-12 11:00:00", "user_id": 2, '
+    '"location": "Lao", "device": "pc", "ip_address": "10.0.0.2", "event_attribute": []}',
+    '{"event_id": "3", "event_type": "play", "timestamp": "2023-08-13 09:00:00", "user_id": 3, '
+    '"location": "Thailand", "device": "web", "ip_address": "10.0.0.3", "event_attribute": {"play_time": 10}}',
+]
+
+
+def test_local_backend_list_blobs_by_prefix(tmp_path):
+    backend = LocalStorageBackend(str(tmp_path))
+    backend.upload_from_string(BUCKET_NAME, "bronze-zone/event_info/2023/08/12/a.json", "a", "application/json")
+    backend.upload_from_string(BUCKET_NAME, "bronze-zone/event_info_old/b.json", "b", "application/json")
+    backend.upload_from_string(BUCKET_NAME, "bronze-zone/user_info/user_info.json", "c", "application/json")
+
+    names = [blob.name for blob in backend.list_blobs(BUCKET_NAME, "bronze-zone/event_info")]
+
+    assert names == ["bronze-zone/event_info/2023/08/12/a.json", "bronze-zone/event_info_old/b.json"]
+    assert backend.list_blobs(BUCKET_NAME, "missing/prefix") == []
+    assert backend.exists(BUCKET_NAME, "bronze-zone/user_info/user_info.json")
+    assert backend.download_bytes(backend.list_blobs(BUCKET_NAME, "bronze-zone/user")[0]) == b"c"
+
+
+def test_upload_from_string_does_not_overwrite(tmp_path):
+    backend = LocalStorageBackend(str(tmp_path))
+    upload_from_string("first", BUCKET_NAME, "bronze-zone/user_info/user_info.json", backend=backend)
+    upload_from_string("second", BUCKET_NAME, "bronze-zone/user_info/user_info.json", backend=backend)
+
+    blob = backend.list_blobs(BUCKET_NAME, "bronze-zone/user_info")[0]
+    assert blob.download_as_bytes() == b"first"
+
+
+def test_pipeline_on_local_backend(tmp_path):
+    data_dir = tmp_path / "data"
+    for day, lines in (("2023-08-12", EVENTS[:2]), ("2023-08-13", EVENTS[2:])):
+        (data_dir / day).mkdir(parents=True)
+        (data_dir / day / f"events-{day}.json").write_text("\n".join(lines) + "\n")
+    backend = LocalStorageBackend(str(tmp_path / "storage"))
+
+    upload_file_to_storage(str(data_dir), BUCKET_NAME, "bronze-zone/event_info", backend=backend)
+    blobs = list_file_in_bucket(BUCKET_NAME, "bronze-zone/event_info", backend=backend)
+    assert [blob.name for blob in blobs] == [
+        "bronze-zone/event_info/2023/08/12/events-2023-08-12.json",
+        "bronze-zone/event_info/2023/08/13/events-2023-08-13.json",
+    ]
+    for blob in blobs:
+        extract_transform_load_event_to_parquet(blob, BUCKET_NAME, "gold-zone/event_info", event_json_schema(), backend=backend)
+
+    dataset = ds.dataset(backend.dataset_root(BUCKET_NAME, "gold-zone/event_info"), format="parquet", partitioning="hive")
+    table = dataset.to_table()
+    assert table.num_rows == 3
+    assert sorted(table.column("day").to_pylist()) == [12, 12, 13]
+
+
+def test_storage_backend_from_config(tmp_path):
+    env_file = tmp_path / ".env"
+    env_file.write_text(f'STORAGE_BACKEND="local"\nLOCAL_STORAGE_ROOT="{tmp_path}"\n')
+    backend = storage_backend_from_config(Config(RepositoryEnv(str(env_file))))
+    assert isinstance(backend, LocalStorageBackend)
+    assert backend.root_dir == str(tmp_path)
+
+    env_file.write_text('STORAGE_BACKEND="gcs"\nGCS_POOL_SIZE=8\nGCS_TIMEOUT=5\n')
+    backend = storage_backend_from_config(Config(RepositoryEnv(str(env_file))))
+    assert isinstance(backend, GcsStorageBackend)
+    assert backend.pool_size == 8
+    assert backend.timeout == 5.0